@@ -1,50 +1,165 @@
 import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from python.src.functions.read_TBE import read_tbe_file
+from python.src.functions.scan_manifest import ScanManifest, file_signature
+
+
+def summarize_tbe_file(filepath, with_signature=False):
+    """
+    Parse a TBE file with the project's reader and summarize its tables.
+    Runs in the worker processes in parallel mode, so it only returns data.
+    :param filepath: Path to the TBE file.
+    :param with_signature: Also return the manifest signature (size, mtime, SHA-1) of the
+        file, taken before it is parsed, so the hash is computed in the worker.
+    :return: Dictionary with the file path, one summary per table and the total number of records,
+        and the signature if requested.
+    """
+    signature = file_signature(filepath) if with_signature else None
+    tbe_file = read_tbe_file(filepath)
+    table_summaries = [
+        {
+            "name": table.name,
+            "columns": len(table.headers),
+            "records": len(table),
+            "attributes": list(table.att),
+        }
+        for table in tbe_file
+    ]
+    file_summary = {
+        "file": filepath,
+        "tables": table_summaries,
+        "records": sum(table["records"] for table in table_summaries),
+    }
+    if signature is not None:
+        file_summary["signature"] = signature
+    return file_summary
 
 
 class TbeBatchProcessor:
     """
     Python implementation of the TBE batch processor.
     Processes all TBE files in a directory and prints a summary to the console.
+    With workers > 1 the files are parsed in parallel in a process pool; the
+    per-file summaries are merged into the counters by the parent process only.
+    With a manifest_path, the summaries are kept in a JSON manifest and files
+    that did not change since the previous run are not parsed again.
     """
 
-    def __init__(self):
+    def __init__(self, workers=1, manifest_path=None):
+        self.workers = workers
+        self.manifest = ScanManifest(manifest_path) if manifest_path else None
         self.total_files = 0
         self.processed_files = 0
         self.skipped_files = 0
         self.total_records = 0
+        self.file_summaries = []
+
+    def record_file_summary(self, file_summary):
+        """
+        Merge the summary of one processed file into the counters.
+        :param file_summary: Dictionary returned by summarize_tbe_file.
+        """
+        signature = file_summary.pop("signature", None)
+        print(f"Processed {file_summary['file']}: {len(file_summary['tables'])} tables, "
+              f"{file_summary['records']} records")
+        if self.manifest is not None:
+            self.manifest.update(file_summary["file"], file_summary, signature)
+        self.file_summaries.append(file_summary)
+        self.processed_files += 1
+        self.total_records += file_summary["records"]
+
+    def record_file_error(self, filepath, error):
+        """
+        Count a file that could not be processed.
+        :param filepath: Path to the TBE file.
+        :param error: Exception raised while processing the file.
+        """
+        print(f"Error processing file {filepath}: {error}")
+        self.skipped_files += 1
 
     def process_tbe_file(self, filepath):
         """
-        Process a single TBE file by counting the number of lines (records).
+        Process a single TBE file by parsing its tables and counting their data records.
         :param filepath: Path to the TBE file.
         """
         try:
-            with open(filepath, "r") as file:
-                record_count = sum(1 for _ in file)
-            print(f"Processed {filepath}: {record_count} records")
-            self.processed_files += 1
-            self.total_records += record_count
+            file_summary = summarize_tbe_file(filepath, self.manifest is not None)
         except Exception as e:
-            print(f"Error processing file {filepath}: {e}")
-            self.skipped_files += 1
+            self.record_file_error(filepath, e)
+            return
+        self.record_file_summary(file_summary)
+
+    def process_tbe_files_parallel(self, filepaths):
+        """
+        Process TBE files in a process pool with self.workers workers.
+        :param filepaths: Paths to the TBE files.
+        """
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            with_signature = self.manifest is not None
+            futures = {executor.submit(summarize_tbe_file, filepath, with_signature): filepath
+                       for filepath in filepaths}
+            for future in as_completed(futures):
+                try:
+                    file_summary = future.result()
+                except Exception as e:
+                    self.record_file_error(futures[future], e)
+                    continue
+                self.record_file_summary(file_summary)
+
+    def reuse_unchanged_summaries(self, filepaths):
+        """
+        Count the files whose summary in the manifest is still valid without parsing them.
+        :param filepaths: Paths to the TBE files.
+        :return: Paths of the new or changed files that still have to be parsed.
+        """
+        changed = []
+        for filepath in filepaths:
+            file_summary = self.manifest.lookup(filepath)
+            if file_summary is None:
+                changed.append(filepath)
+                continue
+            file_summary = dict(file_summary, file=filepath)
+            print(f"Unchanged {filepath}: {file_summary['records']} records")
+            self.file_summaries.append(file_summary)
+            self.processed_files += 1
+            self.total_records += file_summary["records"]
+        return changed
 
     def process_tbe_directory(self, dirpath):
         """
         Process all TBE files in a directory.
         :param dirpath: Path to the directory containing TBE files.
+        :return: List of per-file table summaries, sorted by file path.
         """
         if not os.path.isdir(dirpath):
             raise NotADirectoryError(f"Invalid directory: {dirpath}")
 
+        filepaths = []
         for entry in os.scandir(dirpath):
             if entry.is_file() and entry.name.endswith("_tbe.csv"):
-                self.process_tbe_file(entry.path)
+                filepaths.append(entry.path)
             else:
                 print(f"Skipped non-TBE file: {entry.name}")
                 self.skipped_files += 1
 
+        if self.manifest is not None:
+            filepaths = self.reuse_unchanged_summaries(filepaths)
+
+        if self.workers > 1 and len(filepaths) > 1:
+            self.process_tbe_files_parallel(filepaths)
+        else:
+            for filepath in filepaths:
+                self.process_tbe_file(filepath)
+
+        if self.manifest is not None:
+            self.manifest.prune()
+            self.manifest.save()
+
+        self.file_summaries.sort(key=lambda file_summary: file_summary["file"])
         self.total_files = self.processed_files + self.skipped_files
         self.print_summary()
+        return self.file_summaries
 
     def print_summary(self):
         """
@@ -73,6 +188,10 @@ class TbeBatchProcessor:
                 file.write(f"Total records: {self.total_records}\n")
                 if self.processed_files > 0:
                     file.write(f"Average records per file: {self.total_records / self.processed_files:.2f}\n")
+                for file_summary in self.file_summaries:
+                    file.write(f"\n{file_summary['file']}:\n")
+                    for table in file_summary["tables"]:
+                        file.write(f"  {table['name']}: {table['records']} records, {table['columns']} columns\n")
             print(f"Metadata summary written to {output_file}")
         except Exception as e:
             print(f"Error writing metadata summary: {e}")
@@ -82,11 +201,13 @@ if __name__ == "__main__":
     import sys
 
     if len(sys.argv) < 2:
-        print("Usage: python c_tbe_integration.py <directory_to_process>")
+        print("Usage: python c_tbe_integration.py <directory_to_process> [workers] [manifest.json]")
         sys.exit(1)
 
     directory_to_process = sys.argv[1]
-    processor = TbeBatchProcessor()
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    manifest_path = sys.argv[3] if len(sys.argv) > 3 else None
+    processor = TbeBatchProcessor(workers=workers, manifest_path=manifest_path)
 
     try:
         processor.process_tbe_directory(directory_to_process)
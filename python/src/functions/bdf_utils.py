@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 
@@ -18,30 +20,119 @@ def printf(*args):
     """
     print(*args, "\n")
 
+# Substitutions of saq_sitename2id, applied in order to the lower case site name
+SITEID_SUBSTITUTIONS = [
+    (re.compile(r'[.,\'() /-]+'), '_'),
+    (re.compile(r'(?i)_of_'), '_'),
+    (re.compile(r'(?i)university'), 'u'),
+    (re.compile(r'(?i)univ'), 'u'),
+    (re.compile(r'(?i)airport'), 'apt'),
+    (re.compile(r'(?i)campus'), ''),
+    (re.compile(r'(?i)school'), ''),
+    (re.compile(r'_+$'), ''),
+    (re.compile(r'^_+'), ''),
+    (re.compile(r'_+'), '_'),
+    (re.compile(r'cox_s'), 'cox'),  # shorten cox_s_bazar to cox_bazar
+]
+SITEID_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=SITEID_CACHE_SIZE)
 def saq_sitename2id(stname=''):
     """
     Make siteid from sitename by removing special characters and shortening
     siteid is lower case, snake case
 
+    The patterns are compiled once (SITEID_SUBSTITUTIONS) and the results are
+    kept in an LRU cache, so repeated site names are only converted once.
+
     Returns:
     - Shortened site name for use in programming
 
     Family: bdf_utils
     """
     stid = stname.lower()
-    stid = re.sub(r'[.,\'() /-]+', '_', stid)
-    stid = re.sub(r'(?i)_of_', '_', stid)
-    stid = re.sub(r'(?i)university', 'u', stid)
-    stid = re.sub(r'(?i)univ', 'u', stid)
-    stid = re.sub(r'(?i)airport', 'apt', stid)
-    stid = re.sub(r'(?i)campus', '', stid)
-    stid = re.sub(r'(?i)school', '', stid)
-    stid = re.sub(r'_+$', '', stid)
-    stid = re.sub(r'^_+', '', stid)
-    stid = re.sub(r'_+', '_', stid)
-    stid = re.sub(r'cox_s', 'cox', stid)  # shorten cox_s_bazar to cox_bazar
+    for pattern, replacement in SITEID_SUBSTITUTIONS:
+        stid = pattern.sub(replacement, stid)
     return stid
 
+def saq_sitenames2ids(stnames):
+    """
+    Make siteids for many site names at once (vectorized saq_sitename2id)
+
+    Each distinct site name is converted once, then the ids are broadcast to
+    all rows, so a column of raw Level1 rows with a few dozen sites costs a few
+    dozen conversions.
+
+    Parameters:
+    - stnames: Series, list or array of site names
+
+    Returns:
+    - Series of siteids (same index as stnames if it is a Series); missing names stay missing
+
+    Family: bdf_utils
+    """
+    stnames = stnames if isinstance(stnames, pd.Series) else pd.Series(stnames, dtype=object)
+    codes, uniques = pd.factorize(stnames)
+    ids = np.array([saq_sitename2id(str(stname)) for stname in uniques] + [np.nan], dtype=object)
+    return pd.Series(ids[codes], index=stnames.index, name=stnames.name)
+
+class AttributeIndex:
+    """
+    Attribute table (tibble with metadata) indexed by variable for O(1) lookups
+
+    Build it once per table and use it instead of calling get_attribute_check
+    with the table for every variable.
+
+    Parameters:
+    - tc: Tibble with metadata (attributes), as accepted by get_attribute_check;
+      a DataFrame keeps all its attribute columns
+
+    Family: bdf_utils
+    """
+    __slots__ = ('attributes', 'records', 'counts')
+
+    def __init__(self, tc=None):
+        if isinstance(tc, pd.DataFrame):
+            tc_df = tc
+        else:
+            tc_df = pd.DataFrame(tc, columns=['Variable', 'Units', 'DisplayName'])
+        self.attributes = set(tc_df.columns)
+        self.records = {}
+        self.counts = {}
+        if 'Variable' in self.attributes:
+            for record in tc_df.to_dict('records'):
+                variable = record['Variable']
+                self.counts[variable] = self.counts.get(variable, 0) + 1
+                self.records.setdefault(variable, record)
+
+    def get_attribute_check(self, varselect='pm25', attselect='Units'):
+        """
+        Get attribute with checking and diagnostics, see get_attribute_check
+
+        Returns:
+        - result: attribute value, error: Error code if failed
+        """
+        if 'Variable' not in self.attributes:
+            return {'result': None, 'error': f'Could not find Variable in input tibble for get_attribute_check'}
+        if attselect not in self.attributes:
+            return {'result': None, 'error': f'Could not find attribute {attselect} in input tibble for get_attribute_check'}
+        count = self.counts.get(varselect, 0)
+        if count == 0:
+            return {'result': None, 'error': f'Could not find entry for {varselect} in input tibble for get_attribute_check'}
+        elif count > 1:
+            return {'result': None, 'error': f'Found multiple ({count}) entries for {varselect} in input tibble for get_attribute_check'}
+        return {'result': self.records[varselect][attselect], 'error': None}
+
+    def get_attribute(self, varselect='pm25', attselect='Units'):
+        """
+        Get attribute, see get_attribute
+
+        Returns:
+        - Attribute or ''
+        """
+        rtn = self.get_attribute_check(varselect, attselect)
+        return '' if rtn['error'] is not None else rtn['result']
+
 def get_attribute(tc=[('date','pm25','pm10'),
                       ('Asia/Dhaka','ug/m3','ug/m3'),
                       ('Local Time','PM2.5','PM10')],
@@ -51,7 +142,7 @@ def get_attribute(tc=[('date','pm25','pm10'),
     Get attribute from tibble with metadata, return attribute or empty string
 
     Parameters:
-    - tc: Tibble with metadata (attributes)
+    - tc: Tibble with metadata (attributes), or an AttributeIndex built from it
     - varselect: Row entry to select inside tibble (assumes names are in Variable)
     - attselect: Attribute to select
 
@@ -60,18 +151,8 @@ def get_attribute(tc=[('date','pm25','pm10'),
 
     Family: bdf_utils
     """
-    tc_df = pd.DataFrame(tc, columns=['Variable', 'Units', 'DisplayName'])
-    if 'Variable' not in tc_df.columns:
-        return ''
-    if attselect not in tc_df.columns:
-        return ''
-    tcf = tc_df[tc_df['Variable'] == varselect]
-    if tcf.shape[0] == 0:
-        return ''
-    elif tcf.shape[0] > 1:
-        return ''
-    var_attribute = tcf[attselect].iloc[0]
-    return var_attribute
+    tc_index = tc if isinstance(tc, AttributeIndex) else AttributeIndex(tc)
+    return tc_index.get_attribute(varselect, attselect)
 
 def get_attribute_check(tc=[('date','pm25','pm10'),
                             ('Asia/Dhaka','ug/m3','ug/m3'),
@@ -81,8 +162,11 @@ def get_attribute_check(tc=[('date','pm25','pm10'),
     """
     Get attribute from tibble with metadata with checking and diagnostics
 
+    For repeated lookups in the same tibble, build an AttributeIndex once and
+    pass it instead of the tibble.
+
     Parameters:
-    - tc: Tibble with metadata (attributes)
+    - tc: Tibble with metadata (attributes), or an AttributeIndex built from it
     - varselect: Row entry to select inside tibble (assumes names are in Variable)
     - attselect: Attribute to select
 
@@ -91,18 +175,8 @@ def get_attribute_check(tc=[('date','pm25','pm10'),
 
     Family: bdf_utils
     """
-    tc_df = pd.DataFrame(tc, columns=['Variable', 'Units', 'DisplayName'])
-    if 'Variable' not in tc_df.columns:
-        return {'result': None, 'error': f'Could not find Variable in input tibble for get_attribute_check'}
-    if attselect not in tc_df.columns:
-        return {'result': None, 'error': f'Could not find attribute {attselect} in input tibble for get_attribute_check'}
-    tcf = tc_df[tc_df['Variable'] == varselect]
-    if tcf.shape[0] == 0:
-        return {'result': None, 'error': f'Could not find entry for {varselect} in input tibble for get_attribute_check'}
-    elif tcf.shape[0] > 1:
-        return {'result': None, 'error': f'Found multiple ({tcf.shape[0]}) entries for {varselect} in input tibble for get_attribute_check'}
-    var_attribute = tcf[attselect].iloc[0]
-    return {'result': var_attribute, 'error': None}
+    tc_index = tc if isinstance(tc, AttributeIndex) else AttributeIndex(tc)
+    return tc_index.get_attribute_check(varselect, attselect)
 
 def df_transpose(df):
     """
@@ -2,225 +2,488 @@
     Read tbe file
 
     Parameters:
-    - flin: File name 
-    - flsource: Source: 'extdata' or directory 
+    - flin: File name, or a TBEFile already parsed by read_TBE.read_tbe_file (the file
+      is not read again; use_index, use_mmap, chunksize and use_cache do not apply)
+    - flsource: Source: 'extdata' or directory
     - tblselect: Null: Read all tables, or name of table to read
+    - use_mmap: Memory-map the file instead of reading it into memory
+    - use_index: Keep the table index in a '.tbeidx' sidecar next to flin; a fresh
+      sidecar is used instead of scanning the file, and only the bytes of the
+      selected tables are read
+    - use_cache: Keep the parsed tables in a binary '.tbecache.npz' cache next to flin
+      (see tbe_cache); a fresh cache is loaded instead of parsing the file (not used
+      with chunksize)
+    - chunksize: Read the data blocks in chunks of this many rows; result[table] is then
+      an iterator of typed DataFrame chunks instead of a DataFrame. Every chunk has the
+      same column types: Integer columns are float64 (a later chunk may have blanks)
+      and Name columns are text with blanks as NaN (their categories are not known
+      before the last chunk), see CHUNK_DTYPES
 
     Returns:
     - result: Dictionary of dataframes with tables and metadata, error: Error Message
 
+    The file is read once into memory and scanned once for the TBL/ATT/BGN/CMT/EOT
+    rows (see tbe_index.scan_tbe_index). Each table block is then parsed directly
+    from its byte range in the buffer, so the cost is linear in the file size
+    regardless of the number of tables. With use_mmap=True the file is mapped
+    instead of read, and each data block is handed to the CSV parser as a view
+    of the mapped bytes. With use_index=True the scan is skipped when the
+    sidecar index is still valid. With chunksize, the file is scanned through a
+    memory map and each data block is parsed lazily, chunk by chunk, so files
+    larger than memory can be processed table by table. With use_cache=True a
+    fresh cache of the typed tables is loaded without reading the CSV text; when
+    the cache is missing or stale the file is parsed and, if all tables were
+    read, the cache is written.
+
     Variable Descriptions:
-    - tf: Temporary dataframe used to store the CSV data.
-    - tf_codes: Stores the first three characters of the first column in the CSV.
-    - tf_description: Stores the rest of the content in the first column after the first three characters.
-    - itbl_header: Indices where tables start (i.e., where 'TBL' is found).
-    - ntables: Number of tables in the CSV.
-    - iheader: Index of the current table header.
+    - buf: Content of the input file (bytes, or mmap with use_mmap), read once (None if the sidecar index is used).
+    - tbe_index: Table index from the single-pass scan or the sidecar (byte ranges of each table).
+    - tbl_buf: Bytes the current table is parsed from (buf, or the table's own byte range).
+    - ntables: Number of tables in the file.
+    - tbl_entry: Index entry of the current table.
     - tbl_str: Table name in lowercase.
-    - ilast: Last possible row in the current table.
-    - ieot: Index of 'EOT' in the current table.
-    - iend: Index of the end of data in the current table.
-    - istart: Index of the start of data in the current table.
-    - ndata: Number of data rows in the current table.
-    - hdr_all: All column headers in the current table.
-    - tbl_name: Current table name.
+    - hdr_all: All column headers in the current table (without the TBL cell).
     - hdr_select: Column indices that have headers (non-empty).
-    - hdr: Selected column headers for the current table.
     - hdr_data: Data column headers for the current table.
-    - itbl_sites: Index of 'TBL Sites'.
-    - ibgn: Index of 'BGN'.
-    - iatt_start: Index to start searching for 'ATT'-prefixed rows.
-    - iatt_end: Index to end searching for 'ATT'-prefixed rows.
-    - att_indices: Boolean series where True indicates the row starts with 'ATT'.
-    - iatt: Index of the first 'ATT'-prefixed row.
-    - iatt1: Adjusted index of the first 'ATT'-prefixed row considering the header.
-    - iatt2: Adjusted index of the last 'ATT'-prefixed row considering the header.
-    - natt: Number of 'ATT'-prefixed rows.
-    - att: Metadata (i.e., 'ATT'-prefixed rows) of the current table.
-    - att_trans: Transposed version of att.
-    - tf_tbl: Data of the current table.
+    - att_trans: Metadata (i.e., 'ATT'-prefixed rows) of the current table, one row per
+      variable with a 'Variable' column and one column per attribute.
+    - iheader: Byte offset of the TBL row of the current table.
+    - istart, iend: Byte range of the data block (BGN row through EOT row).
+    - ndata: Number of data rows in the current table.
+    - tc_index: AttributeIndex of att_trans, built once per table for O(1) attribute lookups.
+    - tzones: Time zones of the time columns, resolved once per table (resolve_time_zones).
+    - col_dtypes: Column types declared by the ATT Units row (Integer -> int64, Number and
+      degrees -> float64, True=... -> bool, Time (zone) -> datetime, Name -> category),
+      applied while the data block is read.
+    - Time columns are parsed with the TBE time format (tbe_table.TBE_TIME_FORMAT) and
+      localized in the zone declared by their ATT Units (localize_time_columns).
+    - tf_tbl: Data of the current table (iterator of chunks with chunksize).
+    - file_entry: Index entry of the current table with offsets into the file (for the chunk reader).
     - tf_tbl_codes: First three characters of tf_tbl's first column.
     - icmt: Boolean series where True indicates the row is a comment.
     - ncmt: Number of comment rows.
-    - tb_gbl: Transposed version of tf_tbl if the current table is 'global'.
     - result: Final output containing all tables and corresponding metadata.
     """
+import mmap
+
+import numpy as np
 import pandas as pd
-import re
-from tzlocal import get_localzone
-from pytz import all_timezones
 
-from .bdf_utils import get_attribute_check
+from .bdf_utils import AttributeIndex
+from .tbe_cache import from_cache, to_cache
+from .tbe_table import BOOL_VALUES, TBEFile, to_typed_series, unit_dtype, unit_time_zone
+from .tbe_index import (TbeBlockReader, load_tbe_index, read_tbe_index, read_tbe_table_bytes,
+                        split_tbe_row, write_tbe_index)
+
+# Column types in chunk mode that do not depend on the values of one chunk
+CHUNK_DTYPES = {'int64': 'float64', 'category': 'str'}
+
+
+def read_tbe_attributes(buf, tbl_entry, hdr_data, hdr_select):
+    """
+    Build the attribute table of one TBE table from its ATT rows
+
+    Parameters:
+    - buf: Content of the TBE file (bytes)
+    - tbl_entry: Index entry of the table
+    - hdr_data: Data column headers
+    - hdr_select: Column indices (into the TBL row, without the TBL cell) to keep
+
+    Returns:
+    - DataFrame with a Variable column and one column per attribute, or None
+    """
+    if not tbl_entry['att']:
+        return None
+
+    att_trans = pd.DataFrame({'Variable': hdr_data})
+    for att_start, att_end in tbl_entry['att']:
+        fields = split_tbe_row(buf[att_start:att_end])
+        att_name = fields[0][4:].strip()
+        values = fields[1:]
+        att_trans[att_name] = [values[i] if i < len(values) else '' for i in hdr_select]
+    return att_trans
+
+
+def get_unit_dtypes(tc_index, hdr_data):
+    """
+    Column types declared by the ATT Units row of a table
+
+    Parameters:
+    - tc_index: AttributeIndex of the table's attributes
+    - hdr_data: Data column headers
+
+    Returns:
+    - List with the type of each data column (see tbe_table.unit_dtype), None where not declared
+    """
+    return [unit_dtype(tc_index.get_attribute(col, 'Units')) for col in hdr_data]
+
+
+def tbe_data_read_options(tbl_entry, hdr_select, col_dtypes):
+    """
+    pd.read_csv options for the data block of one TBE table
+
+    Parameters:
+    - tbl_entry: Index entry of the table
+    - hdr_select: Column indices (into the TBL row, without the TBL cell) to keep
+    - col_dtypes: Type of each data column from get_unit_dtypes
+
+    Returns:
+    - Dictionary of keyword arguments for pd.read_csv
+    """
+    ncols = len(tbl_entry['columns']) + 1
+    usecols = [0] + [i + 1 for i in hdr_select]
+    read_dtypes = {0: str}
+    read_dtypes.update({i + 1: str for i, dtype in zip(hdr_select, col_dtypes) if dtype is not None})
+    return dict(header=None, sep=',', names=range(ncols), usecols=usecols, dtype=read_dtypes,
+                keep_default_na=False)
+
+
+def finish_tbe_data(tf_tbl, tbl_name, hdr_data, col_dtypes):
+    """
+    Remove the CMT rows and the row code column of a parsed data block, name and type its columns
+
+    Parameters:
+    - tf_tbl: DataFrame read with tbe_data_read_options (whole block or one chunk)
+    - tbl_name: Table name, used in messages
+    - hdr_data: Data column headers
+    - col_dtypes: Type of each data column from get_unit_dtypes
+
+    Returns:
+    - DataFrame with the data rows
+    """
+    tf_tbl_codes = tf_tbl[0].astype(str).str[:3]
+    icmt = tf_tbl_codes == 'CMT'
+    ncmt = icmt.sum()
+    if ncmt > 0:
+        print(f"Removing {ncmt} comments from table {tbl_name.lower()}")
+        tf_tbl = tf_tbl[~icmt]
+    tf_tbl = tf_tbl.drop(columns=0).reset_index(drop=True)
+    tf_tbl.columns = hdr_data
+    for col, dtype in zip(hdr_data, col_dtypes):
+        if dtype is not None:
+            tf_tbl[col] = to_typed_series(tf_tbl[col], dtype)
+    return tf_tbl
+
+
+def read_tbe_data(buf, tbl_entry, hdr_data, hdr_select, col_dtypes=None):
+    """
+    Parse the data block of one TBE table straight from the file buffer
+
+    Parameters:
+    - buf: Content of the TBE file (bytes or mmap)
+    - tbl_entry: Index entry of the table
+    - hdr_data: Data column headers
+    - hdr_select: Column indices (into the TBL row, without the TBL cell) to keep
+    - col_dtypes: Type of each data column from get_unit_dtypes; these columns are read
+      as text and converted once (int64, float64, bool, datetime, category), the other
+      columns are left to the pandas type inference
+
+    Returns:
+    - DataFrame with the data rows (CMT rows removed), or None if there is no data
+    """
+    istart, iend = tbl_entry['data']
+    if tbl_entry['nrows'] == 0:
+        return None
+    if col_dtypes is None:
+        col_dtypes = [None] * len(hdr_data)
+
+    read_options = tbe_data_read_options(tbl_entry, hdr_select, col_dtypes)
+    with TbeBlockReader(buf, istart, iend) as block:
+        tf_tbl = pd.read_csv(block, **read_options)
+    return finish_tbe_data(tf_tbl, tbl_entry['name'], hdr_data, col_dtypes)
+
+
+def iter_tbe_data(flin, tbl_entry, hdr_data, hdr_select, col_dtypes, tzones, chunksize):
+    """
+    Parse the data block of one TBE table in chunks of rows
+
+    The file is memory-mapped when the first chunk is requested and unmapped
+    once the last chunk has been read (or the iterator is closed), so only
+    one chunk of the table is held in memory at a time. The time zones are
+    resolved once for the table; the messages about the time columns are
+    printed once, with the number of values set to NaT over all chunks after
+    the last chunk.
+
+    Parameters:
+    - flin: File name
+    - tbl_entry: Index entry of the table, with offsets into the file
+    - hdr_data: Data column headers
+    - hdr_select: Column indices (into the TBL row, without the TBL cell) to keep
+    - col_dtypes: Type of each data column from get_unit_dtypes, used for every chunk
+      after mapping through CHUNK_DTYPES
+    - tzones: Time zone of each time column from resolve_time_zones
+    - chunksize: Number of rows per chunk (CMT rows included)
+
+    Returns:
+    - Generator of DataFrames with typed, tz-aware columns (CMT rows removed)
+    """
+    if tbl_entry['nrows'] == 0:
+        return
+    istart, iend = tbl_entry['data']
+    col_dtypes = [CHUNK_DTYPES.get(dtype, dtype) for dtype in col_dtypes]
+    read_options = tbe_data_read_options(tbl_entry, hdr_select, col_dtypes)
+    nnat = {}
+    with open(flin, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        with TbeBlockReader(buf, istart, iend) as block, \
+                pd.read_csv(block, chunksize=chunksize, **read_options) as reader:
+            for tf_chunk in reader:
+                tf_chunk = finish_tbe_data(tf_chunk, tbl_entry['name'], hdr_data, col_dtypes)
+                if len(tf_chunk) == 0:
+                    continue
+                for col, tzone in tzones.items():
+                    if not pd.api.types.is_datetime64_dtype(tf_chunk[col]):
+                        if col not in nnat:
+                            print(f'WARNING: Column {col} with timezone ({tzone}) is not a valid time, leave as is')
+                            nnat[col] = None
+                        continue
+                    if col not in nnat:
+                        print(f'Found valid time and timezone ({tzone}) for column {col}')
+                    tf_chunk[col], nnat_chunk = localize_time_column(tf_chunk[col], tzone)
+                    nnat[col] = (nnat.get(col) or 0) + nnat_chunk
+                yield tf_chunk
+    for col, nnat_col in nnat.items():
+        if nnat_col is not None:
+            print(f'{nnat_col} ambiguous or nonexistent times in column {col} set to NaT')
+
+
+def resolve_time_zones(tc_index, hdr_data):
+    """
+    Time zones of all time columns of a table, resolved once from its ATT Units
+
+    Parameters:
+    - tc_index: AttributeIndex of the table's attributes
+    - hdr_data: Data column headers
+
+    Returns:
+    - Dictionary column name -> IANA time zone name
+    """
+    tzones = {}
+    for col in hdr_data:
+        tzone, error = unit_time_zone(tc_index.get_attribute(col, 'Units'))
+        if error is not None:
+            print(f'{error} for column {col}, leave as is')
+        elif tzone is not None:
+            tzones[col] = tzone
+    return tzones
+
+
+def localize_time_column(column, tzone):
+    """
+    Localize one parsed time column in its declared zone
+
+    The clock times repeated when daylight saving time ends are inferred from
+    the order of the rows (ambiguous='infer'), which is kept when the localized
+    column is in time order. Otherwise, and for times skipped when daylight
+    saving time starts, the ambiguous and nonexistent times become NaT.
+
+    Parameters:
+    - column: Time column parsed to (naive) datetime64
+    - tzone: IANA time zone name
+
+    Returns:
+    - (tz-aware column, number of values set to NaT)
+    """
+    localized = None
+    try:
+        localized = column.dt.tz_localize(tzone, ambiguous='infer', nonexistent='NaT')
+    except ValueError:
+        pass
+    if localized is None or not localized.dropna().is_monotonic_increasing:
+        localized = column.dt.tz_localize(tzone, ambiguous='NaT', nonexistent='NaT')
+    return localized, int(localized.isna().sum() - column.isna().sum())
+
+
+def localize_time_columns(tf_tbl, tzones):
+    """
+    Attach the declared time zone to the time columns of a table
+
+    Times in a TBE file are written in the zone declared by their ATT Units
+    ('Time (Etc/UTC)' or a bare zone name such as 'Asia/Dhaka'), so the parsed
+    (naive) times are localized in that zone, independent of the machine's
+    local time zone (see localize_time_column for daylight saving changes).
+
+    Parameters:
+    - tf_tbl: Data of the table, time columns already parsed to datetime64
+    - tzones: Time zone of each time column from resolve_time_zones
+
+    Returns:
+    - tf_tbl with tz-aware time columns
+    """
+    for col, tzone in tzones.items():
+        if not pd.api.types.is_datetime64_dtype(tf_tbl[col]):
+            print(f'WARNING: Column {col} with timezone ({tzone}) is not a valid time, leave as is')
+            continue
+        print(f'Found valid time and timezone ({tzone}) for column {col}')
+        tf_tbl[col], nnat = localize_time_column(tf_tbl[col], tzone)
+        print(f'{nnat} ambiguous or nonexistent times in column {col} set to NaT')
+    return tf_tbl
+
+
+def infer_text_series(series):
+    """
+    Type of a column without declared ATT Units, as pd.read_csv infers it for read_tbe_data
+
+    Parameters:
+    - series: pandas Series of strings
+
+    Returns:
+    - bool or numeric Series if all values are booleans or numbers, else the input Series
+      (blank values keep the column as text)
+    """
+    if (series == '').any():
+        return series
+    if series.isin(('True', 'TRUE', 'true', 'False', 'FALSE', 'false')).all():
+        return series.map(BOOL_VALUES).astype(bool)
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series
+
+
+def tbe_file_tables(tbe_file, tblselect=None):
+    """
+    Tables of a TBEFile in the form returned by ebs_read_tbe
+
+    The columns of the model are typed and localized as ebs_read_tbe types the
+    columns it reads from the file, so a file parsed once by read_tbe_file can
+    be used by the code written for ebs_read_tbe.
 
-def ebs_read_tbe(flin='./Dku_bluesky_analysis/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv', flsource='extdata', tblselect=None):
+    Parameters:
+    - tbe_file: TBEFile from read_TBE.read_tbe_file
+    - tblselect: None for all tables, or name of the table to return
+
+    Returns:
+    - Dictionary of dataframes with tables and metadata, as result in ebs_read_tbe
+    """
+    result = {}
+    for table in tbe_file:
+        tbl_str = table.name.lower()
+        if tblselect is not None and tbl_str != tblselect.lower():
+            continue
+        hdr_select = [i for i, hdr in enumerate(table.headers) if hdr != '']
+        hdr_data = [table.headers[i] for i in hdr_select]
+
+        att_trans = None
+        if table.att:
+            att_trans = pd.DataFrame({'Variable': hdr_data})
+            for att_name, values in table.att.items():
+                att_trans[att_name] = [values[i] if i < len(values) else '' for i in hdr_select]
+        tc_index = AttributeIndex(att_trans)
+
+        tf_tbl = None
+        if len(table) > 0:
+            columns = {}
+            for ncol, (i, dtype) in enumerate(zip(hdr_select, get_unit_dtypes(tc_index, hdr_data))):
+                column = table.columns[i]
+                if isinstance(column, np.ndarray):
+                    # Already typed by TBETable.convert_types
+                    columns[ncol] = pd.Series(column)
+                elif dtype is not None:
+                    columns[ncol] = to_typed_series(pd.Series(column, dtype=str), dtype)
+                else:
+                    columns[ncol] = infer_text_series(pd.Series(column, dtype=str))
+            tf_tbl = pd.DataFrame(columns)
+            tf_tbl.columns = hdr_data
+            tf_tbl = localize_time_columns(tf_tbl, resolve_time_zones(tc_index, hdr_data))
+
+        result[tbl_str] = tf_tbl
+        result['tc_' + tbl_str] = att_trans
+    return result
+
+
+def ebs_read_tbe(flin='./Dku_bluesky_analysis/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv', flsource='extdata', tblselect=None, use_index=False, use_mmap=False,
+                 chunksize=None, use_cache=False):
+
+    if isinstance(flin, TBEFile):
+        print(f'Using tables already read from {flin.path}')
+        return {'result': tbe_file_tables(flin, tblselect), 'error': None}
 
     result = {}  # initialize output
 
-    tf = pd.read_csv(flin, header=None, sep=',', usecols=[0, 1], keep_default_na=False)
-    nrecs = len(tf)
-    print("tf: ", tf)
-    tf_codes = tf[0].str[:3]
-    print("tf_codes: \n", tf_codes)
-    tf_description = tf[0].str[4:]
-    print("tf_description: \n", tf_description)
-    itbl_header = tf_codes[tf_codes == 'TBL'].index
-    ntables = len(itbl_header)
+    use_cache = use_cache and chunksize is None
+    if use_cache:
+        cached = from_cache(flin)
+        if cached is not None:
+            print(f'Using cached tables for {flin}')
+            if tblselect is not None:
+                cached = {key: tbl for key, tbl in cached.items()
+                          if key in (tblselect.lower(), 'tc_' + tblselect.lower())}
+            return {'result': cached, 'error': None}
+
+    buf = None
+    tbe_index = load_tbe_index(flin) if use_index else None
+    if tbe_index is None:
+        buf, tbe_index = read_tbe_index(flin, use_mmap=use_mmap or chunksize is not None)
+        if use_index:
+            write_tbe_index(flin, buf, tbe_index)
+    else:
+        print(f'Using table index for {flin}')
+    ntables = len(tbe_index)
     print("ntables \n", ntables)
 
-    for ntbl in range(1, ntables + 1):
-        att_trans = None
-        iheader = itbl_header[ntbl - 1]
-        tbl_str = tf_description[iheader].lower()
+    for ntbl, tbl_entry in enumerate(tbe_index, 1):
+        tbl_str = tbl_entry['name'].lower()
         if tblselect is not None and tbl_str != tblselect.lower():
             print(f'Skipping table {tbl_str}')
             continue
 
-        if ntbl < ntables:
-            ilast = itbl_header[ntbl] - 1
+        iheader = tbl_entry['header'][0]
+        istart, iend = tbl_entry['data']
+        ndata = tbl_entry['nrows']
+        file_entry = tbl_entry
+        if buf is None:
+            # In chunk mode the data block is read by iter_tbe_data, only the attributes are read here
+            tbl_buf, tbl_entry = read_tbe_table_bytes(flin, tbl_entry, header_only=chunksize is not None)
         else:
-            ilast = nrecs
+            tbl_buf = buf
 
-        ieot = (tf_codes[(iheader + 1):ilast] == 'EOT').idxmax()
-        skipdata = False
-        if pd.notnull(ieot):
-            iend = iheader + ieot
-        else:
-            inotblank = ((tf[1][(iheader + 1):ilast] != '') & (tf[0][(iheader + 1):ilast] == '')).idxmax()
-            if pd.notnull(inotblank):
-                iend = iheader + inotblank
-                print(f'EOT not found for table {ntbl}/{ntables}, using iend = {iend}')
-            else:
-                inotblank2 = (tf[1][(iheader + 1):ilast] != '').idxmax()
-                if pd.notnull(inotblank2):
-                    iend = iheader + inotblank2
-                    print(f'Found metadata but no data for table {ntbl}/{ntables}, using iend = {iend}')
-                    skipdata = True
-                else:
-                    print(f'No data and no metadata found for table {ntbl}/{ntables} (consider fixing your file)')
-                    continue
+        hdr_all = tbl_entry['columns']
+        hdr_select = [i for i, hdr in enumerate(hdr_all) if hdr != '']
+        hdr_data = [hdr_all[i] for i in hdr_select]
 
-        if skipdata:
-            istart = iend + 1
-            ndata = 0
-        else:
-            ibgn = (tf_codes[(iheader + 1):iend] == 'BGN').idxmax()
-            if pd.notnull(ibgn):
-                istart = iheader + ibgn
-            else:
-                iblank = (tf[0][(iheader + 1):iend] == '').idxmax()
-                if pd.notnull(iblank):
-                    istart = iheader + iblank
-                else:
-                    istart = iend
-                    print(f'BGN not found for table {ntbl}/{ntables}, using istart = {istart}')
-            ndata = iend - istart + 1
-
-        hdr_all = pd.read_csv(flin, header=None, sep=',', skiprows=iheader, nrows=1, keep_default_na=False)
-        tbl_name = hdr_all[0].str.replace('^TBL ', '')
-        tbl_name = tbl_name.str.replace('\s', '_')
-        hdr_select = hdr_all.columns[~hdr_all.isna().any()]
-        hdr = hdr_all[hdr_select].reset_index(drop=True)
-        hdr[0] = 'TBL_' + tbl_name
-        print("tbl_name debug:", tbl_name)
-        hdr_data = hdr_all[hdr_select].reset_index(drop=True)
-
-        itbl_sites = (tf[0] == 'TBL Sites').idxmax()
-        # print("itbl_sites: ", itbl_sites)
-        ibgn = (tf[0][itbl_sites:] == 'BGN').idxmax()
-
-        if pd.notnull(itbl_sites) and pd.notnull(ibgn):
-            iatt_start = itbl_sites + 1
-            iatt_end = ibgn - 1
-            print("iatt_start: ", iatt_start)
-            print("iatt_end: ", iatt_end)
-            print("tf_codes[iatt_start:iatt_end]: ",tf_codes[iatt_start:iatt_end] )
-            att_indices = tf_codes[iatt_start:iatt_end].str.startswith('ATT')
-
-            if not att_indices.any():
-                print(f"No 'ATT' rows found between 'TBL Sites' and 'BGN' for table {ntbl}/{ntables}")
-                continue
-
-            iatt = att_indices.idxmax()
-        else:
-            print(f"'TBL Sites' or 'BGN' row not found for table {ntbl}/{ntables}")
-            if pd.notnull(iatt):
-                iatt1 = iatt + iheader
-                iatt2 = iheader + (tf_codes[(iheader + 1):(istart - 1)] == 'ATT').last_valid_index()
-                natt = iatt2 - iatt1 + 1
-                att = pd.read_csv(flin, header=None, sep=',', skiprows=iatt1, nrows=natt, usecols=hdr_select,
-                                keep_default_na=False)
-                att.columns = hdr.iloc[0]
-                att = att.iloc[iatt - iatt1]
-                att.columns = hdr_data.iloc[0]
-                att_trans = att.transpose().reset_index()
-                att_trans.columns = att_trans.iloc[0]
-                att_trans = att_trans[1:]
-                att_trans.columns.values[0] = 'Variable'
-            else:
-                print(f'No attributes found for Table {ntbl}/{ntables}')
-                att_trans = None
+        att_trans = read_tbe_attributes(tbl_buf, tbl_entry, hdr_data, hdr_select)
+        if att_trans is None:
+            print(f'No attributes found for Table {ntbl}/{ntables}')
 
-        if ndata > 0:
-            tf_tbl = pd.read_csv(flin, header=None, sep=',', skiprows=istart, nrows=ndata, usecols=hdr_select,
-                                 keep_default_na=False)
-            tf_tbl_codes = tf_tbl[0].str[:3]
-            icmt = tf_tbl_codes == 'CMT'
-            ncmt = icmt.sum()
-            if ncmt > 0:
-                print(f'Removing {ncmt} comments from table {tbl_str}')
-                tf_tbl = tf_tbl[~icmt]
-            tf_tbl.drop(columns=0, inplace=True)
-            tf_tbl.columns = hdr_data.columns[:len(tf_tbl.columns)]
-            for col in tf_tbl.columns:
-                rtn = get_attribute_check(att_trans, col, 'Units')
-                if rtn is None or pd.isnull(rtn['result']):
-                    continue
-                if tf_tbl[col].dtype == 'datetime64[ns]':
-                    tzone = re.match(r'Time\s*\(\s*(.*)\s*\)', rtn['result'])
-                    if tzone:
-                        tzone = tzone.group(1)
-                        if tzone in all_timezones:
-                            print(f'Found valid time and timezone ({tzone}) for column {col}')
-                            tf_tbl[col] = tf_tbl[col].dt.tz_localize(get_localzone()).dt.tz_convert(tzone)
-                        else:
-                            print(f'Invalid timezone ({tzone}) for column {col}, leave as is')
-                    elif rtn['result'] in all_timezones:
-                        tzone = rtn['result']
-                        print(f'Inferred time, found timezone ({tzone}) for column {col}')
-                        tf_tbl[col] = tf_tbl[col].dt.tz_localize(get_localzone()).dt.tz_convert(tzone)
-                    else:
-                        print(f'WARNING: No timezone found for variable {col}, leave as is')
-                else:
-                    continue
+        if ndata > 0 and not tbl_entry['eot']:
+            print(f'EOT not found for table {ntbl}/{ntables}, using iend = {iend}')
+
+        tc_index = AttributeIndex(att_trans)
+        col_dtypes = get_unit_dtypes(tc_index, hdr_data)
+        tzones = resolve_time_zones(tc_index, hdr_data)
+        if chunksize is not None:
+            tf_tbl = iter_tbe_data(flin, file_entry, hdr_data, hdr_select, col_dtypes, tzones, chunksize)
         else:
-            tf_tbl = None
+            tf_tbl = read_tbe_data(tbl_buf, tbl_entry, hdr_data, hdr_select, col_dtypes)
+            if tf_tbl is not None:
+                tf_tbl = localize_time_columns(tf_tbl, tzones)
 
         if tf_tbl is None:
             print(f"Data for table {tbl_str} is None")
-            result[tbl_str] = None
-        elif tbl_str.lower() == 'global':
-            tb_gbl = tf_tbl.transpose().reset_index()
-            result[tbl_str] = tb_gbl.rename(columns={0: 'Variable'})
-        
+        result[tbl_str] = tf_tbl
+
         if att_trans is None:
             print(f"Metadata for table {tbl_str} is None")
-            result['tc_' + tbl_str] = tf_tbl
-        else:
-            result['tc_' + tbl_str] = att_trans
+        result['tc_' + tbl_str] = att_trans
         print(f'Added tables {tbl_str} and tc_{tbl_str} to the result dictionary')
 
-        print(f'Tables {tbl_str} and tc_{tbl_str} for table {ntbl}/{ntables}: {tf_description[iheader]}')
+        print(f"Tables {tbl_str} and tc_{tbl_str} for table {ntbl}/{ntables}: {tbl_entry['name']}")
         if ndata > 0:
-            print(f'  Rows: header at {iheader}, data from {istart} to {iend}')
+            print(f"  Bytes: header at {iheader}, {ndata} data rows from {istart} to {iend}")
         elif att_trans is not None:
-            print(f'  Rows: header at {iheader}, metadata only from {iatt1} to {iatt2}')
+            print(f"  Bytes: header at {iheader}, metadata only")
         else:
-            print(f'  Rows: header only at {iheader}, no data, no metadata')
+            print(f"  Bytes: header only at {iheader}, no data, no metadata")
+
+    if isinstance(buf, mmap.mmap):
+        buf.close()
+
+    if use_cache and tblselect is None:
+        to_cache(flin, result)
 
     print(f'Finished reading file: {flin}')
     print('**************** END OF EBS_READ_TBE *************')
     print(f'************************************************** \n\n')
-    print(result)
     return {'result': result, 'error': None}
 
 
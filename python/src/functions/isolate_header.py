@@ -3,6 +3,8 @@ import re
 from typing import Optional, List
 
 class Attribute:
+    __slots__ = ('name', 'value')
+
     def __init__(self, name: str, value: str):
         self.name = name.strip('"')
         self.value = value.strip('"')
@@ -11,6 +13,8 @@ class Attribute:
         return f"{self.name}: {self.value}"
 
 class TBLSection:
+    __slots__ = ('name', 'attributes')
+
     def __init__(self, name: str):
         self.name = name.strip('"')
         self.attributes: List[Attribute] = []
@@ -22,6 +26,8 @@ class TBLSection:
         return f"TBL Section: {self.name}\n" + "\n".join(str(attr) for attr in self.attributes)
 
 class TBEHeader:
+    __slots__ = ('bgn_attributes', 'eot_attributes', 'sections')
+
     def __init__(self):
         self.bgn_attributes: List[Attribute] = []
         self.eot_attributes: List[Attribute] = []
@@ -45,32 +51,45 @@ class TBEHeader:
             "\n".join(str(section) for section in self.sections)
         )
 
-def trim_newline(line: str) -> str:
-    return line.strip()
+HEADER_ROW_CODES = ('TBL', 'ATT', 'BGN', 'EOT')
+
+def _tbe_lines(file, state: dict, header_only: bool):
+    """Yields the lines of a TBE file, keeping the line number in state.
 
-def split_csv_line(line: str) -> List[str]:
-    """Splits a CSV line into tokens, handling quoted fields."""
-    reader = csv.reader([line])
-    return next(reader)
+    With header_only, data rows (any line that does not start with a header
+    row code) are skipped without being tokenized.
+    """
+    for line_number, line in enumerate(file, 1):
+        if header_only and not line.startswith(HEADER_ROW_CODES):
+            continue
+        state['line_number'] = line_number
+        yield line
 
-def parse_tbe_header(filename: str) -> Optional[TBEHeader]:
+def parse_tbe_header(filename: str, header_only: bool = False) -> Optional[TBEHeader]:
+    """Parses the header information of a TBE file.
+
+    All lines are tokenized by a single csv reader. With header_only=True only the
+    TBL, ATT, BGN and EOT rows are tokenized: the BGN and EOT rows of each table
+    are kept, the rows between them are skipped, so the cost depends on the
+    number of header rows instead of the size of the data blocks.
+    """
     header = TBEHeader()
     current_section: Optional[TBLSection] = None
     in_bgn_section = False
     in_eot_section = False
+    state = {'line_number': 0}
 
     try:
-        with open(filename, 'r') as file:
-            for line_number, line in enumerate(file, 1):
-                line = trim_newline(line)
+        with open(filename, 'r', newline='') as file:
+            reader = csv.reader(_tbe_lines(file, state, header_only))
+            for tokens in reader:
+                line_number = state['line_number']
 
                 # Skip empty lines or delimiter-only lines
-                if not line or all(c in ', ' for c in line):
-                    continue
-
-                tokens = split_csv_line(line)
-                if not tokens:
+                if not any(token.strip() for token in tokens):
                     continue
+                tokens[0] = tokens[0].lstrip()
+                tokens[-1] = tokens[-1].rstrip()
 
                 # Handle section headers
                 if tokens[0].startswith("BGN"):
@@ -0,0 +1,331 @@
+"""
+    Ingestion of TSI Bluesky Level1.csv files
+
+    read_level1_files reads many Level1 files into one DataFrame. Each file is
+    read in chunks with only the columns used by the analysis (LEVEL1_COLUMNS)
+    and explicit dtypes; rows of other sites are dropped chunk by chunk while
+    reading, and the per-file frames are concatenated once at the end.
+
+    Column names are matched by their R names (make.names, as used by the
+    original R analysis: 'Site Name' -> 'Site.Name', 'PM2.5 (ug/m3)' ->
+    'PM2.5..ug.m3.'), so files with either spelling of the header can be read.
+
+    Output columns: sitename (category), date (tz-aware), pm25, pm25_scale,
+    Latitude, Longitude.
+
+    read_level1_sites reads the Level1 files of the sites of a Sites table
+    (ebs_read_tbe), found by serial number in a '<indir>/<period>/<serial>/'
+    directory tree, in a thread pool and adds the siteid of each row.
+
+    Level1Deduplicator drops repeated (site, timestamp) rows, e.g. from
+    overlapping monthly exports, file by file as the files are read: it keeps
+    the timestamps already seen for each site as a sorted int64 array and
+    counts the duplicates of each file. The first occurrence is kept, in the
+    order the files are read; the merged data is never sorted.
+
+    apply_pm25_scale fills in the calibration factor (pm25_scale) of each site
+    for the rows recorded before it was applied, with one groupby over all
+    sites.
+    """
+import os
+import re
+import glob
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# R name of the Level1 column -> output column name
+LEVEL1_COLUMNS = {
+    'Site.Name': 'sitename',
+    'Timestamp..UTC.': 'date',
+    'PM2.5..ug.m3.': 'pm25',
+    'Applied.PM2.5.Custom.Calibration.Factor': 'pm25_scale',
+    'Latitude': 'Latitude',
+    'Longitude': 'Longitude',
+}
+LEVEL1_DTYPES = {
+    'Site.Name': str,
+    'Timestamp..UTC.': str,
+    'PM2.5..ug.m3.': 'float64',
+    'Applied.PM2.5.Custom.Calibration.Factor': 'float64',
+    'Latitude': 'float64',
+    'Longitude': 'float64',
+}
+LEVEL1_REQUIRED = ('Site.Name', 'Timestamp..UTC.', 'PM2.5..ug.m3.')
+LEVEL1_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+LEVEL1_CHUNK_ROWS = 100000
+LEVEL1_FILE_NAME = 'Level1.csv'
+
+
+def r_column_name(name):
+    """
+    R name of a column (make.names): characters other than letters, digits, '.' and '_' become '.'
+
+    Parameters:
+    - name: Column name from the file header
+
+    Returns:
+    - R column name
+    """
+    return re.sub(r'[^A-Za-z0-9._]', '.', name.strip())
+
+
+def empty_level1_frame(timezone_output='UTC'):
+    """Empty DataFrame with the output columns of read_level1_file"""
+    tb = pd.DataFrame({column: pd.Series(dtype='float64') for column in LEVEL1_COLUMNS.values()})
+    tb['sitename'] = pd.Series(dtype='category')
+    tb['date'] = pd.Series(dtype=f'datetime64[ns, {timezone_output}]')
+    return tb
+
+
+def read_level1_file(flin, sitenames=None, timezone_output='UTC', chunksize=LEVEL1_CHUNK_ROWS):
+    """
+    Read the columns used by the analysis from one Level1.csv file
+
+    Parameters:
+    - flin: Level1.csv file name
+    - sitenames: Site names (Site.Name) to keep, None keeps all sites
+    - timezone_output: Time zone of the date column (the file has UTC times)
+    - chunksize: Number of rows read at a time; rows of other sites are dropped per chunk
+
+    Returns:
+    - DataFrame with sitename (str), date, pm25, pm25_scale, Latitude, Longitude
+      (the optional columns only if they are in the file)
+    """
+    header = pd.read_csv(flin, nrows=0).columns
+    usecols = {name: r_column_name(name) for name in header if r_column_name(name) in LEVEL1_COLUMNS}
+    missing = [column for column in LEVEL1_REQUIRED if column not in usecols.values()]
+    if missing:
+        raise ValueError(f"Level1 file {flin} is missing columns {missing}")
+    site_column = next(name for name, rname in usecols.items() if rname == 'Site.Name')
+    if sitenames is not None:
+        sitenames = set(sitenames)
+
+    chunks = []
+    with pd.read_csv(flin, usecols=list(usecols), dtype={name: LEVEL1_DTYPES[rname] for name, rname in usecols.items()},
+                     chunksize=chunksize) as reader:
+        for chunk in reader:
+            if sitenames is not None:
+                chunk = chunk[chunk[site_column].isin(sitenames)]
+            if len(chunk) > 0:
+                chunks.append(chunk)
+    if not chunks:
+        return empty_level1_frame(timezone_output)
+
+    tb = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else chunks[0].reset_index(drop=True)
+    tb = tb.rename(columns={name: LEVEL1_COLUMNS[rname] for name, rname in usecols.items()})
+    tb['date'] = pd.to_datetime(tb['date'], format=LEVEL1_TIME_FORMAT, utc=True).dt.tz_convert(timezone_output)
+    return tb
+
+
+def level1_time_keys(dates):
+    """int64 nanoseconds (UTC) of a date column, the time part of the duplicate keys"""
+    return dates.dt.as_unit('ns').dt.tz_convert('UTC').dt.tz_localize(None).to_numpy(dtype='datetime64[ns]').view('int64')
+
+
+class Level1Deduplicator:
+    """
+    Drops rows whose (site, timestamp) was already read, one file at a time
+
+    Parameters:
+    - site_column: Column with the site of each row (siteid, or sitename for read_level1_files)
+
+    Attributes:
+    - counts: Dictionary source file -> number of duplicate rows dropped from it
+    """
+
+    def __init__(self, site_column='siteid'):
+        self.site_column = site_column
+        self.site_keys = {}
+        self.counts = {}
+
+    @property
+    def nduplicates(self):
+        """Total number of duplicate rows dropped"""
+        return sum(self.counts.values())
+
+    def drop_duplicates(self, tb, source):
+        """
+        Drop the rows of one file that repeat a row of the same file or of a file read before
+
+        Parameters:
+        - tb: DataFrame of one file with the site column and date
+        - source: Name of the file, the key of counts
+
+        Returns:
+        - DataFrame with the first occurrence of each (site, timestamp), in the original row order
+        """
+        times = level1_time_keys(tb['date'])
+        keep = np.zeros(len(tb), dtype=bool)
+        for site, rows in tb.groupby(self.site_column, observed=True, sort=False, dropna=False).indices.items():
+            new_times, first = np.unique(times[rows], return_index=True)
+            seen = self.site_keys.get(site)
+            if seen is None:
+                self.site_keys[site] = new_times
+            else:
+                pos = np.searchsorted(seen, new_times)
+                is_seen = seen[np.minimum(pos, len(seen) - 1)] == new_times
+                new_times, first, pos = new_times[~is_seen], first[~is_seen], pos[~is_seen]
+                self.site_keys[site] = np.insert(seen, pos, new_times)
+            keep[rows[first]] = True
+
+        nduplicates = len(tb) - int(keep.sum())
+        self.counts[source] = self.counts.get(source, 0) + nduplicates
+        if nduplicates > 0:
+            print(f"Dropped {nduplicates} duplicate rows from {source}")
+            return tb[keep].reset_index(drop=True)
+        return tb
+
+
+def read_level1_files(aflin, sitenames=None, timezone_output='UTC', deduplicator=None):
+    """
+    Read many Level1.csv files into one DataFrame
+
+    Parameters:
+    - aflin: List of Level1.csv file names
+    - sitenames: Site names (Site.Name) to keep, None keeps all sites
+    - timezone_output: Time zone of the date column
+    - deduplicator: Level1Deduplicator('sitename') to drop duplicate rows file by file, None keeps all rows
+
+    Returns:
+    - DataFrame with sitename (category), date, pm25, pm25_scale, Latitude, Longitude;
+      the frames of all files are concatenated once
+    """
+    frames = []
+    for flin in aflin:
+        tb_sub = read_level1_file(flin, sitenames, timezone_output)
+        if deduplicator is not None:
+            tb_sub = deduplicator.drop_duplicates(tb_sub, flin)
+        if tb_sub.empty:
+            continue
+        print(f"Read {flin}: {len(tb_sub)} rows from {tb_sub['date'].min()} to {tb_sub['date'].max()}")
+        frames.append(tb_sub)
+
+    if not frames:
+        return empty_level1_frame(timezone_output)
+    tb_all = pd.concat(frames, ignore_index=True)
+    tb_all['sitename'] = tb_all['sitename'].astype('category')
+    print(f"Read {len(frames)} files, {len(tb_all)} rows from {tb_all['date'].min()} to {tb_all['date'].max()}")
+    return tb_all
+
+
+def find_level1_files(indir, serials):
+    """
+    Find the Level1 files of the given serial numbers in '<indir>/<period>/<serial>/Level1.csv'
+
+    The directory tree is listed once for all serial numbers.
+
+    Parameters:
+    - indir: Root directory of the Level1 data
+    - serials: Serial numbers of the sensors
+
+    Returns:
+    - List of (file name, serial number) in file name order
+    """
+    serials = {str(serial) for serial in serials}
+    aflin = []
+    for flin in sorted(glob.glob(os.path.join(glob.escape(os.fspath(indir)), '*', '*', LEVEL1_FILE_NAME))):
+        serial = os.path.basename(os.path.dirname(flin))
+        if serial in serials:
+            aflin.append((flin, serial))
+    return aflin
+
+
+def read_level1_sites(tb_sites, indir, siteids=None, timezone_output='UTC', workers=8, deduplicator=None):
+    """
+    Read the Level1 files of the sites in a Sites table in parallel
+
+    Parameters:
+    - tb_sites: Sites table from ebs_read_tbe (sitename, siteid and serial_number columns)
+    - indir: Root directory of the Level1 data, one '<period>/<serial>/' directory per file
+    - siteids: Site ids to read, None reads all sites of tb_sites
+    - timezone_output: Time zone of the date column
+    - workers: Number of files read at the same time
+    - deduplicator: Level1Deduplicator to drop duplicate rows file by file, in file name
+      order as the files are read, None keeps all rows
+
+    Returns:
+    - DataFrame as returned by read_level1_files with a siteid column (category)
+    """
+    tb_select = tb_sites if siteids is None else tb_sites[tb_sites['siteid'].isin(siteids)]
+    serials = tb_select['serial_number'].astype('int64').astype(str)
+    site_index = {}
+    for serial, sitename, siteid in zip(serials, tb_select['sitename'].astype(str), tb_select['siteid'].astype(str)):
+        site_index.setdefault(serial, {})[sitename] = siteid
+
+    aflin = find_level1_files(indir, site_index)
+    print(f"Found {len(aflin)} Level1 files for {len(site_index)} serial numbers in {indir}")
+
+    def read_serial_file(flin_serial):
+        flin, serial = flin_serial
+        tb_sub = read_level1_file(flin, site_index[serial], timezone_output)
+        tb_sub['siteid'] = tb_sub['sitename'].map(site_index[serial])
+        return tb_sub
+
+    def keep_frames(frames):
+        for (flin, _), tb_sub in zip(aflin, frames):
+            if deduplicator is not None:
+                tb_sub = deduplicator.drop_duplicates(tb_sub, flin)
+            if not tb_sub.empty:
+                yield tb_sub
+
+    if workers > 1 and len(aflin) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            frames = list(keep_frames(executor.map(read_serial_file, aflin)))
+    else:
+        frames = list(keep_frames(map(read_serial_file, aflin)))
+
+    if not frames:
+        tb_all = empty_level1_frame(timezone_output)
+        tb_all['siteid'] = pd.Series(dtype='category')
+        return tb_all
+    tb_all = pd.concat(frames, ignore_index=True)
+    tb_all['sitename'] = tb_all['sitename'].astype('category')
+    tb_all['siteid'] = tb_all['siteid'].astype('category')
+    print(f"Read {len(frames)} files, {len(tb_all)} rows from {tb_all['date'].min()} to {tb_all['date'].max()}")
+    return tb_all
+
+
+def apply_pm25_scale(tb, site_column='siteid'):
+    """
+    Apply the calibration factor of each site to its rows without pm25_scale
+
+    Sites with one pm25_scale value get their rows with a missing pm25_scale
+    scaled by it; sites with several values (flagged in the summary) or none
+    are left as they are. Adds the columns pm25_v0 (pm25 without the
+    calibration factor) and pm25_scale_calc (pm25 / pm25_v0) to tb.
+
+    Parameters:
+    - tb: DataFrame with site_column, pm25 and pm25_scale, changed in place
+    - site_column: Column with the site of each row
+
+    Returns:
+    - DataFrame indexed by site with nscale (number of pm25_scale values),
+      pm25_scale (the factor applied, NaN if none) and nfilled (rows scaled)
+    """
+    scale = tb['pm25_scale'].to_numpy(dtype='float64')
+    pm25 = tb['pm25'].to_numpy(dtype='float64')
+    grouped = tb.groupby(site_column, observed=True, sort=False, dropna=False)['pm25_scale']
+    tb_scale = grouped.agg(['nunique', 'first']).rename(columns={'nunique': 'nscale', 'first': 'pm25_scale'})
+    tb_scale['pm25_scale'] = tb_scale['pm25_scale'].where(tb_scale['nscale'] == 1)
+
+    # Factor of the site of each row, NaN where the row has its own factor
+    row_site = grouped.ngroup().to_numpy()
+    factor = tb_scale['pm25_scale'].to_numpy()[row_site]
+    fill = np.isnan(scale) & ~np.isnan(factor)
+    tb_scale['nfilled'] = np.bincount(row_site[fill], minlength=len(tb_scale))
+
+    pm25_v0 = pm25 / scale
+    tb['pm25_v0'] = pm25_v0
+    tb['pm25'] = np.where(fill, pm25 * factor, pm25)
+    tb['pm25_scale_calc'] = tb['pm25'].to_numpy() / pm25_v0
+
+    for row in tb_scale.itertuples():
+        if row.nscale == 0:
+            print(f"pm25_scale not found for {row.Index}, do nothing")
+        elif row.nscale == 1:
+            print(f"Applied pm25_scale = {row.pm25_scale} to {row.nfilled} values from site {row.Index} for which pm25_scale==NA")
+        else:
+            print(f"Multiple pm25_scale found for {row.Index}, do nothing for now")
+    return tb_scale
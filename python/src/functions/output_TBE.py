@@ -1,74 +1,137 @@
+"""
+    Write TBE files
+
+    TbeWriter writes each table in canonical order: the TBL row, the ATT rows,
+    the CMT rows, then the data rows (BGN on the first, EOT on the last), with
+    a ',,,' row between tables. Rows are formatted by csv.writer and written in
+    bulk through a large file buffer; the data rows can come from any iterable
+    (e.g. a generator), so a table never has to be held in memory.
+
+    export_to_tbe writes a TBEFile from read_TBE.read_tbe_file (or the tables
+    returned by read_TBE.parse_tbe), so a file read and written again reads
+    back to the same tables.
+
+    Run from the repository root:
+    python -m python.src.functions.output_TBE
+    """
 import csv
+import math
+
+import numpy as np
+
+from .read_TBE import read_tbe_file
+from .tbe_table import TBEFile
+
+TBE_TABLE_SEPARATOR = ',,,'
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+def format_tbe_value(value):
+    """
+    Text of one value in a TBE file
+
+    Floats are written with the shortest representation that reads back to the
+    same value, without '.0' for whole numbers; NaN is written as a blank cell.
+    """
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (bool, np.bool_)):
+        return 'True' if value else 'False'
+    if isinstance(value, (float, np.floating)):
+        if math.isnan(value):
+            return ''
+        if value.is_integer():
+            return str(int(value))
+        return repr(float(value))
+    return str(value)
+
+
+def iter_table_rows(table):
+    """Data rows of a TBETable as lists of strings, one value per header"""
+    columns = [[format_tbe_value(value) for value in (column.tolist() if isinstance(column, np.ndarray) else column)]
+               for column in table.columns]
+    return zip(*columns)
+
+
+class TbeWriter:
+    """
+    Buffered writer for TBE files
+
+    Use it as a context manager:
+
+        with TbeWriter('out_tbe.csv') as writer:
+            writer.write_table('Sites', headers, rows, att={'Units': units})
+    """
+
+    def __init__(self, output_path, buffer_size=WRITE_BUFFER_SIZE):
+        self.output_path = output_path
+        self.file = open(output_path, 'w', newline='', buffering=buffer_size)
+        self.writer = csv.writer(self.file, lineterminator='\n')
+        self.ntables = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def write_table(self, name, headers, rows, att=None, cmt=None, eot_name=None):
+        """
+        Write one table
+
+        Parameters:
+        - name: Table name for the TBL row
+        - headers: Column headers
+        - rows: Iterable of data rows, each a sequence of strings aligned with headers
+        - att: Dictionary attribute name -> list of values per column (ATT rows)
+        - cmt: Dictionary comment type -> list of values (CMT rows)
+        - eot_name: Name on the EOT row (default: the table name)
+
+        Returns:
+        - Number of data rows written
+        """
+        if self.ntables > 0:
+            self.file.write(TBE_TABLE_SEPARATOR + '\n')
+        self.ntables += 1
+
+        self.writer.writerow([f"TBL {name}"] + list(headers))
+        self.writer.writerows([f"ATT {att_name}"] + list(values) for att_name, values in (att or {}).items())
+        self.writer.writerows([f"CMT {cmt_type}"] + list(values) for cmt_type, values in (cmt or {}).items())
+
+        rows = iter(rows)
+        last_row = next(rows, None)
+        if last_row is None:
+            return 0
+        nrows = 1
+
+        def body_rows():
+            # The BGN row and all following rows except the last, one row behind rows
+            nonlocal last_row, nrows
+            code = 'BGN'
+            for row in rows:
+                yield [code, *last_row]
+                code = ''
+                last_row = row
+                nrows += 1
+
+        self.writer.writerows(body_rows())
+        # A single-row table is opened and closed by its EOT row
+        self.writer.writerow([f"EOT {eot_name or name}", *last_row])
+        return nrows
 
-def parse_tbe(file_path):
-    tables = {}
-    current_table_name = ''
-    capturing_data = False
-    headers = []
-    data = []
-    att_data = {}
-    cmt_data = {}
-    bgn_lines = []  
-
-    with open(file_path, 'r') as file:
-        reader = csv.reader(file)
-        
-        for line in reader:
-            line_str = ','.join(line).strip()
-            
-            if line_str.startswith('TBL'):
-                # Extract table name and headers from 'TBL' line
-                parts = line_str.split(',')
-                first_part = parts[0].split(' ')
-                current_table_name = first_part[1].strip()
-                headers = [header.strip() for header in parts[1:]]
-                print(f"Started parsing table '{current_table_name}' with headers: {headers}")
-            elif line_str.startswith('BGN'):
-                # Capture BGN lines exactly as they appear
-                bgn_lines.append(line)
-                capturing_data = True
-                print(f"Found BGN section for table '{current_table_name}'.")
-            elif line_str.startswith('EOT'):
-                # Save the parsed table to the tables dictionary
-                tables[current_table_name] = {
-                    'headers': headers,
-                    'data': data,
-                    'att': att_data,
-                    'cmt': cmt_data,
-                    'bgn': bgn_lines  
-                }
-                capturing_data = False
-                data = []
-                att_data = {}
-                cmt_data = {}
-                bgn_lines = []  
-                print(f"Found EOT section for table '{current_table_name}'.")
-            elif capturing_data:
-                # Capture data rows only after 'BGN' line and before 'EOT'
-                row_data = {headers[index]: value.strip() for index, value in enumerate(line[1:])}
-                data.append(row_data)
-            elif line_str.startswith('ATT'):
-                # Parse and store ATT data
-                parts = line_str.split(',')
-                att_type = parts[0].split(' ')[1]
-                att_values = [value.strip() for value in parts[1:]]
-                att_data[att_type] = att_values
-            elif line_str.startswith('CMT'):
-                # Parse and store CMT data
-                parts = line_str.split(',')
-                cmt_type = parts[0].split(' ')[1]
-                cmt_values = [value.strip() for value in parts[1:]]
-                cmt_data[cmt_type] = cmt_values
-
-    return tables
 
 def validate_tables(tables):
     # Perform validation on all tables
+    if isinstance(tables, TBEFile):
+        tables = tables.to_dict()
     for table_name, table_data in tables.items():
         if 'data' not in table_data or len(table_data['data']) == 0:
             print(f"Validation Error: Table '{table_name}' has no data or missing sections.")
             return False
-        if 'headers' not in table_data or len(table_data['headers']) == 0:
+        if len(table_data['data'].headers) == 0:
             print(f"Validation Error: Table '{table_name}' is missing headers.")
             return False
         if 'att' not in table_data:
@@ -81,43 +144,33 @@ def validate_tables(tables):
 
 
 def export_to_tbe(tables, output_path):
-    with open(output_path, 'w', newline='') as file:
-        writer = csv.writer(file)
-        
+    """
+    Write the tables of a TBE file
+
+    Parameters:
+    - tables: TBEFile, or dictionary table name -> {'data': TBETable, 'att': ..., 'cmt': ...}
+    - output_path: Output file name
+    """
+    if isinstance(tables, TBEFile):
+        tables = tables.to_dict()
+    with TbeWriter(output_path) as writer:
         for table_name, table_data in tables.items():
-            # Write the table name and headers
-            writer.writerow([f"TBL {table_name}"] + table_data['headers'])
-            
-            # Write original BGN lines as captured
-            for bgn_line in table_data['bgn']:
-                writer.writerow(bgn_line)
-            
-            # Write data rows
-            for row in table_data['data']:
-                writer.writerow([None] + list(row.values()))
-            
-            # Write EOT line with metadata
-            writer.writerow([f"EOT {table_name}"] + [row[0] for row in table_data['data'][-1].items()])
-            
-            # Handle ATT and CMT sections
-            if table_data['att']:
-                for att_type, values in table_data['att'].items():
-                    writer.writerow([f"ATT {att_type}"] + values)
-
-            if table_data['cmt']:
-                for cmt_type, values in table_data['cmt'].items():
-                    writer.writerow([f"CMT {cmt_type}"] + values)
+            table = table_data['data']
+            writer.write_table(table_name, table.headers, iter_table_rows(table),
+                               att=table_data['att'], cmt=table_data['cmt'], eot_name=table.eot_name)
 
     print(f"Exported to {output_path} successfully.")
 
-# Test the functionality with your file path
-file_path = '../../../sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
-tables = parse_tbe(file_path)
-
-if tables and validate_tables(tables):
-    print("All tables are valid.")
-    # Export the tables to a new TBE file
-    output_path = 'output_tbe_file.csv'
-    export_to_tbe(tables, output_path)
-else:
-    print("Validation failed.")
+
+if __name__ == "__main__":
+    # Test the functionality with your file path
+    file_path = 'sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
+    tables = read_tbe_file(file_path)
+
+    if tables and validate_tables(tables):
+        print("All tables are valid.")
+        # Export the tables to a new TBE file
+        output_path = 'output_tbe_file.csv'
+        export_to_tbe(tables, output_path)
+    else:
+        print("Validation failed.")
@@ -0,0 +1,184 @@
+"""
+    Columnar (Parquet / Arrow IPC) export of TBE tables
+
+    Every TBL section of a TBE file is written to its own Parquet or Arrow IPC
+    file. The columns keep the types declared by the ATT Units row (see
+    ebs_read_tbe), the ATT rows of each column are stored as field metadata,
+    and the Global table (Variable, Value) is stored as file-level metadata
+    of every exported table, so an export can be reloaded without the TBE file.
+
+    pyarrow is an optional dependency; it is only needed by the functions of
+    this module (pip install pyarrow).
+
+    Run from the repository root:
+    python -m python.src.functions.output_columnar
+    """
+import json
+import logging
+import os
+
+from .ebs_read_tbe import ebs_read_tbe
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+COLUMNAR_FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+TBE_TABLE_KEY = b'tbe.table'
+TBE_GLOBAL_KEY = b'tbe.global'
+
+
+def require_pyarrow():
+    """Raise ImportError if pyarrow is not installed"""
+    if pa is None:
+        raise ImportError("Columnar export requires pyarrow (pip install pyarrow)")
+
+
+def global_metadata(tf_global):
+    """
+    Key/value pairs of the Global table
+
+    Parameters:
+    - tf_global: Data of the Global table (Variable, Value), or None
+
+    Returns:
+    - Dictionary Variable -> Value (as strings)
+    """
+    if tf_global is None or tf_global.shape[1] < 2:
+        return {}
+    return {str(key): str(value) for key, value in zip(tf_global.iloc[:, 0], tf_global.iloc[:, 1])}
+
+
+def tbl_to_arrow(tf_tbl, tc_tbl, tbl_name, global_meta=None):
+    """
+    Convert one TBE table to an Arrow table with its ATT rows as field metadata
+
+    Parameters:
+    - tf_tbl: Data of the table (DataFrame from ebs_read_tbe)
+    - tc_tbl: Attributes of the table (Variable column and one column per ATT row), or None
+    - tbl_name: Table name from the TBL row
+    - global_meta: Dictionary from global_metadata, stored as file-level metadata
+
+    Returns:
+    - pyarrow.Table
+    """
+    require_pyarrow()
+    table = pa.Table.from_pandas(tf_tbl, preserve_index=False)
+
+    att_by_column = {}
+    if tc_tbl is not None:
+        for record in tc_tbl.to_dict('records'):
+            variable = record.pop('Variable')
+            att_by_column[variable] = {str(att): str(value) for att, value in record.items()}
+
+    fields = [field.with_metadata(att_by_column[field.name]) if att_by_column.get(field.name) else field
+              for field in table.schema]
+    metadata = dict(table.schema.metadata or {})
+    metadata[TBE_TABLE_KEY] = tbl_name.encode('utf-8')
+    metadata[TBE_GLOBAL_KEY] = json.dumps(global_meta or {}).encode('utf-8')
+    return table.cast(pa.schema(fields, metadata=metadata))
+
+
+def write_arrow_table(table, output_file, fmt='parquet'):
+    """
+    Write an Arrow table to a Parquet or Arrow IPC file
+
+    Parameters:
+    - table: pyarrow.Table
+    - output_file: Output file name
+    - fmt: 'parquet' or 'arrow'
+    """
+    if fmt == 'parquet':
+        pq.write_table(table, output_file)
+    else:
+        with pa.OSFile(output_file, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def export_tbl_columnar(flin, output_dir, fmt='parquet'):
+    """
+    Export the TBL data sections of a TBE file to Parquet or Arrow IPC files
+
+    Parameters:
+    - flin: Input TBE file (CSV format)
+    - output_dir: Directory where the files will be saved
+    - fmt: 'parquet' (default) or 'arrow'
+
+    Returns:
+    - List of the files written
+    """
+    require_pyarrow()
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unknown columnar format {fmt}, use one of {list(COLUMNAR_FORMATS)}")
+
+    result = ebs_read_tbe(flin=flin, flsource='')['result']
+    tbl_names = [key for key in result if not key.startswith('tc_')]
+    if not tbl_names:
+        logging.warning(f"No TBL sections found in the file {flin}.")
+        return []
+
+    global_meta = global_metadata(result.get('global'))
+    output_files = []
+    for tbl_str in tbl_names:
+        tf_tbl = result[tbl_str]
+        if tf_tbl is None:
+            logging.warning(f"No data in table {tbl_str}, skipping.")
+            continue
+        table = tbl_to_arrow(tf_tbl, result['tc_' + tbl_str], tbl_str, global_meta)
+        output_file = os.path.join(output_dir, f"{tbl_str}_data{COLUMNAR_FORMATS[fmt]}")
+        write_arrow_table(table, output_file, fmt)
+        logging.info(f"Exported {tbl_str} to {output_file}")
+        output_files.append(output_file)
+    return output_files
+
+
+def read_tbl_columnar(file_path):
+    """
+    Reload a table exported by export_tbl_columnar
+
+    Parameters:
+    - file_path: Parquet ('.parquet') or Arrow IPC ('.arrow') file
+
+    Returns:
+    - Dictionary with 'data' (DataFrame), 'att' (attribute name -> value per column)
+      and 'global' (Global table as Variable -> Value)
+    """
+    require_pyarrow()
+    if file_path.endswith(COLUMNAR_FORMATS['arrow']):
+        with pa.memory_map(file_path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+    else:
+        table = pq.read_table(file_path)
+
+    metadata = table.schema.metadata or {}
+    att = {field.name: {key.decode('utf-8'): value.decode('utf-8') for key, value in field.metadata.items()}
+           for field in table.schema if field.metadata}
+    return {
+        'data': table.to_pandas(),
+        'att': att,
+        'global': json.loads(metadata.get(TBE_GLOBAL_KEY, b'{}')),
+    }
+
+
+if __name__ == "__main__":
+    # Define paths
+    input_directory = "sample_data"
+    output_directory = './output_columnar'
+
+    # Ensure output directory exists
+    if not os.path.exists(output_directory):
+        os.makedirs(output_directory)
+
+    for filename in os.listdir(input_directory):
+        file_path = os.path.join(input_directory, filename)
+        if os.path.isfile(file_path) and filename.endswith('.csv'):
+            logging.info(f"Processing file: {file_path}")
+            export_tbl_columnar(file_path, output_directory)
+        else:
+            logging.warning(f"Skipping non-CSV file: {filename}")
@@ -0,0 +1,142 @@
+"""
+    Hourly and daily aggregation of PM2.5 time series
+
+    aggregate_pm25 computes the mean, count, standard deviation, minimum and
+    maximum of pm25 per site and interval (e.g. '1h', '1D') in one pass over
+    the data: each row gets an integer key (site number * number of intervals
+    + interval number) and the statistics are accumulated per key with NumPy
+    (bincount, minimum.at, maximum.at) instead of a pandas groupby.
+
+    Intervals are aligned as groupby(pd.Grouper(key='date', freq=...)) does:
+    intervals shorter than a day are fixed lengths of time counted from the
+    local midnight of the first day (so the two clock hours repeated when
+    daylight saving time ends are separate intervals), and whole-day intervals
+    follow the local calendar days. The result is a regular
+    grid: every site has a row for every interval from the first to the last
+    interval of the data, with count 0 and NaN statistics where there is no
+    data. Intervals with fewer values than the completeness threshold keep
+    their count, but their statistics are set to NaN.
+
+    Output columns: the site column, date, pm25 (mean), pm25count, pm25std,
+    pm25min, pm25max, and the last Latitude and Longitude of each site.
+    """
+import math
+
+import numpy as np
+import pandas as pd
+
+COORDINATE_COLUMNS = ('Latitude', 'Longitude')
+SAMPLE_FREQ = '15min'
+DAY_NS = pd.Timedelta('1D').value
+
+
+def interval_count_min(freq, completeness, sample_freq=SAMPLE_FREQ):
+    """
+    Minimum number of values for an interval to be complete
+
+    Parameters:
+    - freq: Interval of the aggregation, e.g. '1h'
+    - completeness: Fraction of the expected number of values (0 accepts any interval with data)
+    - sample_freq: Interval of the input data, e.g. '15min'
+
+    Returns:
+    - Minimum count, at least 1
+    """
+    nexpected = pd.Timedelta(freq) / pd.Timedelta(sample_freq)
+    return max(1, math.ceil(completeness * nexpected - 1e-9))
+
+
+def aggregate_pm25(tb, freq='1h', site_column='sitename', value_column='pm25', completeness=0.0,
+                   sample_freq=SAMPLE_FREQ, coords=True):
+    """
+    Mean, count, std, min and max of a value per site and interval on a regular grid
+
+    Parameters:
+    - tb: DataFrame with site_column, date (tz-aware or naive) and value_column
+    - freq: Interval of the aggregation, a fixed frequency such as '1h' or '1D'
+    - site_column: Column with the site of each row
+    - value_column: Column to aggregate
+    - completeness: Fraction of the expected number of values (freq / sample_freq) an
+      interval needs for its statistics; intervals below it get NaN statistics
+    - sample_freq: Interval of the input data
+    - coords: Add the last Latitude and Longitude of each site (if tb has them)
+
+    Returns:
+    - DataFrame with site_column (category), date, value_column (mean) and
+      value_column + 'count', 'std', 'min', 'max', sorted by site and date
+    """
+    step = pd.Timedelta(freq).value
+    count_min = interval_count_min(freq, completeness, sample_freq)
+
+    dates = tb['date']
+    tzone = dates.dt.tz
+    values = tb[value_column].to_numpy(dtype='float64')
+    valid = ~np.isnan(values) & dates.notna().to_numpy()
+
+    site_codes, sites = pd.factorize(tb[site_column], sort=True)
+    valid &= site_codes >= 0
+    nsites = len(sites)
+
+    # Intervals start at the local midnight of the first day; whole days follow the
+    # local calendar (clock time), shorter intervals the elapsed time (UTC)
+    calendar_days = step % DAY_NS == 0
+    origin = dates[valid].min().normalize() if valid.any() else None
+    if tzone is not None:
+        if calendar_days:
+            dates = dates.dt.tz_localize(None)
+            origin = None if origin is None else origin.tz_localize(None)
+        else:
+            dates = dates.dt.tz_convert('UTC').dt.tz_localize(None)
+    origin = 0 if origin is None else origin.value
+    buckets = (dates.dt.as_unit('ns').to_numpy(dtype='datetime64[ns]').view('int64') - origin) // step
+    if valid.any():
+        bucket_first = buckets[valid].min()
+        nbuckets = int(buckets[valid].max() - bucket_first) + 1
+    else:
+        bucket_first, nbuckets = 0, 0
+    nkeys = nsites * nbuckets
+
+    keys = site_codes[valid] * nbuckets + (buckets[valid] - bucket_first)
+    values = values[valid]
+
+    count = np.bincount(keys, minlength=nkeys)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(keys, weights=values, minlength=nkeys) / count
+        deviation = values - mean[keys]
+        std = np.sqrt(np.bincount(keys, weights=deviation * deviation, minlength=nkeys) / (count - 1))
+    std[count < 2] = np.nan
+    vmin = np.full(nkeys, np.inf)
+    np.minimum.at(vmin, keys, values)
+    vmax = np.full(nkeys, -np.inf)
+    np.maximum.at(vmax, keys, values)
+
+    incomplete = count < count_min
+    for stat in (mean, std, vmin, vmax):
+        stat[incomplete] = np.nan
+
+    grid_dates = pd.DatetimeIndex(origin + (bucket_first + np.arange(nbuckets)) * step).as_unit('ns')
+    if tzone is not None and calendar_days:
+        # Days starting at a clock time skipped by a daylight saving change are dropped below
+        grid_dates = grid_dates.tz_localize(tzone, ambiguous=True, nonexistent='NaT')
+    elif tzone is not None:
+        grid_dates = grid_dates.tz_localize('UTC').tz_convert(tzone)
+
+    tb_agg = pd.DataFrame({
+        site_column: pd.Categorical.from_codes(np.repeat(np.arange(nsites), nbuckets), categories=sites),
+        'date': grid_dates[np.tile(np.arange(nbuckets), nsites)],
+        value_column: mean,
+        f'{value_column}count': count,
+        f'{value_column}std': std,
+        f'{value_column}min': vmin,
+        f'{value_column}max': vmax,
+    })
+    tb_agg = tb_agg[tb_agg['date'].notna()].reset_index(drop=True)
+
+    coordinate_columns = [column for column in COORDINATE_COLUMNS if column in tb.columns]
+    if coords and coordinate_columns:
+        tb_coords = tb[coordinate_columns].groupby(site_codes).last()
+        tb_coords = tb_coords.reindex(np.arange(nsites)).to_numpy()
+        site_rows = tb_agg[site_column].cat.codes.to_numpy()
+        for ncol, column in enumerate(coordinate_columns):
+            tb_agg[column] = tb_coords[site_rows, ncol]
+    return tb_agg
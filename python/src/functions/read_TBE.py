@@ -1,72 +1,158 @@
 import csv
+import mmap
 
-def parse_tbe(file_path):
-    tables = {}
-    current_table_name = ''
-    capturing_data = False
-    headers = []
-    data = []
-    att_data = {}
-    cmt_data = {}
+import pandas as pd
 
-    with open(file_path, 'r') as file:
+from .tbe_index import TbeBlockReader, read_tbe_index, split_tbe_row
+from .tbe_table import TBEFile, TBETable
+
+
+def read_tbe_file(file_path, use_mmap=False):
+    """
+    Parse a TBE file into a TBEFile
+
+    The TBL/ATT/BGN/CMT/EOT rows are located by one scan of the file
+    (tbe_index.scan_tbe_index), and each data block is handed to the pandas
+    CSV parser as a view of the file buffer, so there is no per-line Python
+    work for the data rows. Each table keeps its ATT and CMT rows and its data
+    rows (BGN row through EOT row) by column; columns whose ATT Units declare
+    a numeric type are converted to NumPy arrays. Delimiter-only rows inside a
+    data block are kept (blank in every column), as in ebs_read_tbe. With
+    use_mmap=True the file is memory-mapped instead of read into memory.
+    """
+    buf, tbe_index = read_tbe_index(file_path, use_mmap=use_mmap)
+    tbe_file = TBEFile(file_path)
+    try:
+        for tbl_entry in tbe_index:
+            table = TBETable(tbl_entry['name'], tbl_entry['columns'])
+            for att_start, att_end in tbl_entry['att']:
+                fields = split_tbe_row(buf[att_start:att_end])
+                table.att[fields[0][4:].strip()] = [value.strip() for value in fields[1:]]
+            for cmt_start, cmt_end in tbl_entry['cmt']:
+                fields = split_tbe_row(buf[cmt_start:cmt_end])
+                table.cmt[fields[0][4:].strip()] = [value.strip() for value in fields[1:]]
+
+            if tbl_entry['nrows'] > 0:
+                ncols = len(table.headers) + 1
+                with TbeBlockReader(buf, *tbl_entry['data']) as block:
+                    tf_tbl = pd.read_csv(block, header=None, sep=',', names=range(ncols), usecols=range(ncols),
+                                         dtype=str, keep_default_na=False)
+                values = tf_tbl.iloc[:, 1:].apply(lambda col: col.str.strip())
+                # Delimiter-only rows are kept as rows of missing values, as in ebs_read_tbe
+                keep = ~tf_tbl[0].str.startswith('CMT')
+                table.columns = [values[i + 1][keep].tolist() for i in range(len(table.headers))]
+                if tbl_entry['eot']:
+                    _set_eot_name(table, tf_tbl[0].iloc[-1])
+
+            tbe_file.add_table(table.convert_types())
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+
+    return tbe_file
+
+
+def parse_tbe(file_path, use_mmap=False):
+    """
+    Parse a TBE file into columnar tables
+
+    Returns a dictionary table name -> {'data': TBETable, 'att': ..., 'cmt': ...}
+    built from read_tbe_file.
+    """
+    return read_tbe_file(file_path, use_mmap=use_mmap).to_dict()
+
+
+def _set_eot_name(table, eot_cell):
+    """Keep the name on the EOT row of a table if it differs from the table name"""
+    eot_name = eot_cell[4:].strip()
+    if eot_name and eot_name != table.name:
+        table.eot_name = eot_name
+
+
+def _iter_row_batches(reader, state, batch_size):
+    """
+    Yield batches of data rows of the current table from a shared csv reader
+
+    Rows are read up to the next TBL line, which is left in state['line'] for
+    the caller. CMT rows, ATT rows, blank rows and rows after EOT are skipped.
+    """
+    batch = []
+    ended = False
+    line = state['line']
+    while line is not None:
+        code = line[0][:3] if line else ''
+        if code == 'TBL':
+            break
+        if not ended and code not in ('ATT', 'CMT') and any(value.strip() for value in line[1:]):
+            batch.append([value.strip() for value in line[1:]])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if code == 'EOT':
+            ended = True
+        line = next(reader, None)
+    state['line'] = line
+    if batch:
+        yield batch
+
+
+def iter_tables(file_path, batch_size=1000):
+    """
+    Stream the tables of a TBE file without loading the whole file
+
+    Yields one tuple per table: (table_name, headers, att_data, batches), where
+    batches is a generator of lists of at most batch_size data rows (each row a
+    list of values aligned with headers). The batches read from the same open
+    file, so they have to be consumed before moving to the next table; rows
+    that are not consumed are skipped. Memory use is bounded by batch_size.
+    """
+    with open(file_path, 'r', newline='') as file:
         reader = csv.reader(file)
-        
-        for line in reader:
-            line_str = ','.join(line)
-            
-            if line_str.startswith('TBL'):
-                # Extract table name and headers from 'TBL' line
-                parts = line_str.split(',')
-                first_part = parts[0].split(' ')
-                current_table_name = first_part[1].strip()
-                headers = [header.strip() for header in parts[1:]]  
-                data = []  
-                capturing_data = False 
-            elif line_str.startswith('BGN'):
-                # Start capturing data after 'BGN'
-                capturing_data = True
-                row_data = {headers[0]: 'Title', headers[1]: 'Inventory for dku'}
-                data.append(row_data)  
-            elif line_str.startswith('EOT'):
-                # Capture last data row if any and stop capturing data
-                if capturing_data:
-                    row_data = {headers[index]: value.strip() for index, value in enumerate(line[1:])}
-                    data.append(row_data)
-                
-                tables[current_table_name] = {'data': data, 'att': att_data, 'cmt': cmt_data}
-                capturing_data = False  
-                data = []  
-                att_data = {}
-                cmt_data = {}
-            elif capturing_data:
-                # Capture data rows only after 'BGN' line and before 'EOT'
-                row_data = {headers[index]: value.strip() for index, value in enumerate(line[1:])}
-                data.append(row_data)
-            elif line_str.startswith('ATT'):
-                # Parse and store ATT data
-                parts = line_str.split(',')
-                att_type = parts[0].split(' ')[1]
-                att_values = [value.strip() for value in parts[1:]]
-                att_data[att_type] = att_values
-            elif line_str.startswith('CMT'):
-                # Parse and store CMT data
-                parts = line_str.split(',')
-                cmt_type = parts[0].split(' ')[1]
-                cmt_values = [value.strip() for value in parts[1:]]
-                cmt_data[cmt_type] = cmt_values
-
-    return tables
-
-file_path = '../../../sample_data/saq_bluesky_dku_20210715_20230131_inv_tbe.csv'
-tables = parse_tbe(file_path)
-
-# Output the parsed tables data to the console
-print("Available Tables and Their Data:")
-for table_name, table_data in tables.items():
-    print(f"Table: {table_name}")
-    for row in table_data['data']:
-        print(row)
-    print("Attachments:", table_data['att'])
-    print("Comments:", table_data['cmt'])
-    print(f"Table {table_name} ends here.....")
+        line = next(reader, None)
+        while line is not None:
+            if not line or not line[0].startswith('TBL'):
+                line = next(reader, None)
+                continue
+
+            # Table name and headers from the 'TBL' line, attributes from the 'ATT' lines
+            table_name = line[0][4:].strip()
+            headers = [header.strip() for header in line[1:]]
+            att_data = {}
+            line = next(reader, None)
+            while line and line[0].startswith('ATT'):
+                att_data[line[0][4:].strip()] = [value.strip() for value in line[1:]]
+                line = next(reader, None)
+
+            state = {'line': line}
+            batches = _iter_row_batches(reader, state, batch_size)
+            yield table_name, headers, att_data, batches
+            for _ in batches:
+                pass
+            line = state['line']
+
+
+def iter_rows(file_path, table_name, batch_size=1000):
+    """
+    Stream the data rows of one table of a TBE file in batches
+
+    Yields lists of at most batch_size rows (each row a list of values aligned
+    with the table headers); the other tables are skipped without being stored.
+    """
+    for current_table_name, headers, att_data, batches in iter_tables(file_path, batch_size):
+        if current_table_name.lower() == table_name.lower():
+            yield from batches
+            return
+
+
+if __name__ == "__main__":
+    file_path = 'sample_data/saq_bluesky_dku_20210715_20230131_inv_tbe.csv'
+    tables = parse_tbe(file_path)
+
+    # Output the parsed tables data to the console
+    print("Available Tables and Their Data:")
+    for table_name, table_data in tables.items():
+        print(f"Table: {table_name}")
+        print(table_data['data'].to_dataframe())
+        print("Attachments:", table_data['att'])
+        print("Comments:", table_data['cmt'])
+        print(f"Table {table_name} ends here.....")
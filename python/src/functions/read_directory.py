@@ -4,10 +4,15 @@ import logging
 from pathlib import Path
 from datetime import datetime
 
+from .scan_manifest import ScanManifest
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
+SAMPLE_ROWS = 5
+COUNT_CHUNK_SIZE = 1024 * 1024
+
 def validate_directory(directory_path):
     """Ensure the provided directory exists and is valid."""
     if not os.path.exists(directory_path) or not os.path.isdir(directory_path):
@@ -15,49 +20,101 @@ def validate_directory(directory_path):
         raise ValueError(f"Invalid directory path: {directory_path}")
     logger.info(f"Scanning directory: {directory_path}")
 
+def extract_file_stat(file_path):
+    """
+    Extract the file system metadata (name, size, times) of a file.
+    :param file_path: Path to the file.
+    :return: Metadata as a dictionary.
+    """
+    stat = os.stat(file_path)
+    return {
+        "file_name": os.path.basename(file_path),
+        "file_size": stat.st_size,
+        "creation_time": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+        "last_modified_time": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+    }
+
+def decode_line(line):
+    """Decode a line read in binary mode like a text-mode read (universal newlines)."""
+    return line.decode('utf-8').replace('\r\n', '\n')
+
+def count_remaining_lines(f):
+    """
+    Count the lines from the current position to the end of a binary file.
+    The file is read in fixed-size chunks, so memory use does not grow with the file.
+    :param f: File object opened in binary mode.
+    :return: Number of lines, including a last line without a newline.
+    """
+    count = 0
+    last_chunk = b''
+    for chunk in iter(lambda: f.read(COUNT_CHUNK_SIZE), b''):
+        count += chunk.count(b'\n')
+        last_chunk = chunk
+    if last_chunk and not last_chunk.endswith(b'\n'):
+        count += 1
+    return count
+
 def extract_metadata(file_path):
     """
     Extract metadata from a .csv file.
+    Only the header and the sample rows are decoded; the remaining rows are
+    counted in binary chunks, so the file is never held in memory.
     :param file_path: Path to the file.
     :return: Metadata as a dictionary.
     """
     metadata = {}
     try:
-        stat = os.stat(file_path)
-        metadata["file_name"] = os.path.basename(file_path)
-        metadata["file_size"] = stat.st_size
-        metadata["creation_time"] = datetime.fromtimestamp(stat.st_ctime).isoformat()
-        metadata["last_modified_time"] = datetime.fromtimestamp(stat.st_mtime).isoformat()
-
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-
-        if lines:
-            metadata["row_count"] = len(lines) - 1  # Subtract header row
-            header = lines[0].strip().split(',')
-            metadata["column_count"] = len(header)
-            metadata["column_names"] = header
-            metadata["sample_data"] = lines[1:6]  # First 5 rows after header
+        metadata.update(extract_file_stat(file_path))
+
+        with open(file_path, 'rb') as f:
+            header_line = f.readline()
+            if header_line:
+                sample_lines = []
+                for _ in range(SAMPLE_ROWS):
+                    line = f.readline()
+                    if not line:
+                        break
+                    sample_lines.append(line)
+                row_count = len(sample_lines) + count_remaining_lines(f)
+
+                metadata["row_count"] = row_count  # Rows after the header row
+                header = decode_line(header_line).strip().split(',')
+                metadata["column_count"] = len(header)
+                metadata["column_names"] = header
+                metadata["sample_data"] = [decode_line(line) for line in sample_lines]  # First 5 rows after header
         logger.info(f"Successfully parsed: {os.path.basename(file_path)}")
     except Exception as e:
         logger.warning(f"Failed to process file {file_path}: {e}")
         raise
     return metadata
 
-def process_csv_files(directory_path):
+def process_csv_files(directory_path, manifest_path=None):
     """
     Process all .csv files in the directory and collect metadata.
     :param directory_path: Path to the directory.
+    :param manifest_path: Optional JSON manifest of a previous scan; files that did not
+        change since then are not read again, and the manifest is updated.
     :return: List of metadata dictionaries.
     """
+    manifest = ScanManifest(manifest_path) if manifest_path else None
     summary = []
     for file in Path(directory_path).glob("*.csv"):
         try:
-            logger.info(f"Processing file: {file.name}")
-            metadata = extract_metadata(file)
+            metadata = manifest.lookup(file) if manifest else None
+            if metadata is not None:
+                logger.info(f"Unchanged file: {file.name}")
+                metadata = {**metadata, **extract_file_stat(file)}
+            else:
+                logger.info(f"Processing file: {file.name}")
+                metadata = extract_metadata(file)
+                if manifest:
+                    manifest.update(file, metadata)
             summary.append(metadata)
         except Exception as e:
             logger.warning(f"Error processing {file.name}: {e}")
+    if manifest:
+        manifest.prune()
+        manifest.save()
     return summary
 
 def export_summary_to_file(summary, output_file):
@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_sha1(file_path):
+    """
+    Compute the SHA-1 hash of a file's content, reading it in chunks.
+    :param file_path: Path to the file.
+    :return: Hex digest of the content.
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def file_signature(file_path):
+    """
+    Signature of a file as stored in the manifest.
+    Can be computed where the file is parsed (e.g. in a worker process) and passed to ScanManifest.update.
+    :param file_path: Path to the file.
+    :return: Dictionary with size, mtime_ns and sha1.
+    """
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha1": file_sha1(file_path)}
+
+
+class ScanManifest:
+    """
+    JSON manifest of the results of a previous directory scan.
+
+    Each entry is keyed by the absolute file path and stores the file size,
+    modification time and content hash together with the data extracted from
+    the file. A file whose size and modification time are unchanged is not
+    read again; if only the modification time changed, the content hash
+    decides whether the stored data can be reused.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}
+        self.changed = False
+        if os.path.isfile(manifest_path):
+            try:
+                with open(manifest_path, 'r') as f:
+                    manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    self.entries = manifest.get("files", {})
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable manifest {manifest_path}: {e}")
+
+    @staticmethod
+    def key(file_path):
+        """Manifest key of a file (absolute path)."""
+        return os.path.abspath(file_path)
+
+    def lookup(self, file_path):
+        """
+        Return the stored data for a file if the file has not changed since it was stored.
+        :param file_path: Path to the file.
+        :return: Stored data, or None if the file is new or changed.
+        """
+        entry = self.entries.get(self.key(file_path))
+        if entry is None:
+            return None
+        stat = os.stat(file_path)
+        if entry["size"] != stat.st_size:
+            return None
+        if entry["mtime_ns"] != stat.st_mtime_ns:
+            if entry["sha1"] != file_sha1(file_path):
+                return None
+            # Touched but not modified: keep the data, remember the new time
+            entry["mtime_ns"] = stat.st_mtime_ns
+            self.changed = True
+        return entry["data"]
+
+    def update(self, file_path, data, signature=None):
+        """
+        Store the data extracted from a file together with its signature.
+        :param file_path: Path to the file.
+        :param data: JSON-serializable data extracted from the file.
+        :param signature: Signature from file_signature, taken before the file was read;
+            computed here (reading the file again) if None.
+        """
+        if signature is None:
+            signature = file_signature(file_path)
+        self.entries[self.key(file_path)] = dict(signature, data=data)
+        self.changed = True
+
+    def prune(self):
+        """Drop the entries of files that no longer exist."""
+        for key in list(self.entries):
+            if not os.path.exists(key):
+                del self.entries[key]
+                self.changed = True
+
+    def save(self):
+        """Write the manifest if it changed (atomically, through a temporary file)."""
+        if not self.changed:
+            return
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": MANIFEST_VERSION, "files": self.entries}, f)
+        os.replace(tmp_path, self.manifest_path)
+        self.changed = False
+        logger.info(f"Manifest saved to: {self.manifest_path}")
@@ -1,7 +1,16 @@
+import csv
+from concurrent.futures import ThreadPoolExecutor
+
+
 def extract_global_metadata(file_path):
     """
     Extracts the global metadata from a TBE-style CSV file.
 
+    The file is read line by line with a single CSV reader (so quoted values
+    may contain commas) and reading stops as soon as the Global table ends,
+    at its EOT row or at the next TBL row. The EOT row is the last data row
+    of the table, so its Variable and Value are included.
+
     Args:
         file_path (str): Path to the CSV file.
 
@@ -13,31 +22,30 @@ def extract_global_metadata(file_path):
     in_global_section = False  # Track if we're in the metadata section
 
     try:
-        # Read the file
-        with open(file_path, 'r') as file:
-            lines = file.readlines()
-
-        for line in lines:
-            line = line.strip()
-
-            # Start of the global section
-            if line.startswith("TBL Global"):
-                in_global_section = True
-                continue
-
-            # End of the global section
-            if line.startswith("EOT Global"):
-                in_global_section = False
-                continue
-
-            # Process lines in the metadata section
-            if in_global_section and "," in line:
-                parts = line.split(",", 2)
-                if len(parts) >= 2 and parts[1].strip():  # Variable and Value exist
-                    key = parts[1].strip()
-                    value = parts[2].strip() if len(parts) > 2 else ""
+        with open(file_path, 'r', newline='') as file:
+            for row in csv.reader(file):
+                code = row[0].strip() if row else ""
+
+                # Start of the global section
+                if not in_global_section:
+                    if code.startswith("TBL Global"):
+                        in_global_section = True
+                    continue
+
+                # Another table starts: the global section ended without EOT
+                if code.startswith("TBL"):
+                    break
+
+                # Process lines in the metadata section (ATT and CMT rows are not metadata)
+                if not code.startswith(("ATT", "CMT")) and len(row) >= 2 and row[1].strip():
+                    key = row[1].strip()
+                    value = row[2].strip() if len(row) > 2 else ""
                     metadata[key] = value
 
+                # End of the global section
+                if code.startswith("EOT"):
+                    break
+
         if metadata:
             return metadata, None
         else:
@@ -46,6 +54,27 @@ def extract_global_metadata(file_path):
     except FileNotFoundError:
         return {}, f"Error: File not found at {file_path}."
 
+
+def extract_global_metadata_many(file_paths, workers=8):
+    """
+    Extracts the global metadata of many TBE-style CSV files concurrently.
+
+    Reading the Global table is dominated by file I/O, so the files are read
+    in a thread pool.
+
+    Args:
+        file_paths (list): Paths to the CSV files.
+        workers (int): Number of files read at the same time.
+
+    Returns:
+        dict: File path -> (metadata, warning) as returned by extract_global_metadata.
+    """
+    file_paths = list(file_paths)
+    if workers <= 1 or len(file_paths) <= 1:
+        return {file_path: extract_global_metadata(file_path) for file_path in file_paths}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(file_paths, executor.map(extract_global_metadata, file_paths)))
+
 # Example Usage
 if __name__ == "__main__":
     # Specify the file path
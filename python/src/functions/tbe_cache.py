@@ -0,0 +1,153 @@
+"""
+    Binary cache of parsed TBE files
+
+    to_cache stores the result of ebs_read_tbe (the data of every table with
+    its typed columns and the attribute tables built from the ATT rows,
+    including the Global table) in a NumPy '.npz' file next to the TBE file;
+    from_cache loads it back. Loading the arrays is much faster than parsing
+    the CSV text and converting the columns again.
+
+    The cache stores the same signature as the '.tbeidx' sidecar (size,
+    modification time and hash of the first bytes of the TBE file, see
+    tbe_index.tbe_file_signature) and is only used while it still matches.
+
+    Each column is stored as one array, named by table and column position:
+    - numeric and bool columns as they are
+    - time columns as int64 nanoseconds, with the time zone in the metadata
+    - category columns as codes plus an array of the categories
+    - other columns as unicode strings, with a mask of missing values
+    No Python objects are pickled.
+    """
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .tbe_index import tbe_file_signature
+
+TBE_CACHE_SUFFIX = '.tbecache.npz'
+TBE_CACHE_VERSION = 1
+
+
+def tbe_cache_path(flin):
+    """Path of the cache file for a TBE file"""
+    return f'{os.fspath(flin)}{TBE_CACHE_SUFFIX}'
+
+
+def _store_column(arrays, key, column):
+    """Add the arrays of one column to arrays and return its description"""
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        arrays[key] = column.cat.codes.to_numpy()
+        arrays[key + '.categories'] = column.cat.categories.to_numpy(dtype=str)
+        return {'kind': 'category'}
+    if pd.api.types.is_datetime64_any_dtype(column):
+        tzone = None if column.dt.tz is None else str(column.dt.tz)
+        if tzone is not None:
+            column = column.dt.tz_convert('UTC').dt.tz_localize(None)
+        arrays[key] = column.to_numpy(dtype='datetime64[ns]').view('int64')
+        return {'kind': 'datetime', 'tz': tzone}
+    if pd.api.types.is_bool_dtype(column) or pd.api.types.is_numeric_dtype(column):
+        arrays[key] = column.to_numpy()
+        return {'kind': 'numeric'}
+    isna = column.isna().to_numpy()
+    arrays[key] = column.where(~isna, '').astype(str).to_numpy(dtype=str)
+    if isna.any():
+        arrays[key + '.na'] = isna
+    return {'kind': 'text'}
+
+
+def _load_column(arrays, key, desc):
+    """Rebuild one column stored by _store_column"""
+    values = arrays[key]
+    if desc['kind'] == 'category':
+        return pd.Categorical.from_codes(values, categories=arrays[key + '.categories'])
+    if desc['kind'] == 'datetime':
+        column = pd.Series(values.view('datetime64[ns]'))
+        if desc['tz'] is not None:
+            column = column.dt.tz_localize('UTC').dt.tz_convert(desc['tz'])
+        return column
+    if desc['kind'] == 'numeric':
+        return values
+    column = pd.Series(values, dtype='str')
+    if key + '.na' in arrays:
+        column = column.mask(arrays[key + '.na'])
+    return column
+
+
+def to_cache(flin, result):
+    """
+    Store the tables of a parsed TBE file in its cache file
+
+    Parameters:
+    - flin: File name of the TBE file
+    - result: Dictionary of tables from ebs_read_tbe (all tables, with their tc_ tables)
+
+    Returns:
+    - Path of the cache file, or None if it could not be written
+    """
+    arrays = {}
+    tables = {}
+    for ntbl, (tbl_str, tf_tbl) in enumerate(result.items()):
+        if tf_tbl is None:
+            tables[tbl_str] = None
+            continue
+        columns = []
+        for ncol, col in enumerate(tf_tbl.columns):
+            desc = _store_column(arrays, f't{ntbl}/c{ncol}', tf_tbl[col])
+            columns.append(dict(desc, name=col))
+        tables[tbl_str] = {'key': f't{ntbl}', 'columns': columns}
+
+    metadata = {
+        'version': TBE_CACHE_VERSION,
+        'signature': tbe_file_signature(flin),
+        'tables': tables,
+    }
+    arrays['metadata'] = np.array(json.dumps(metadata))
+
+    flcache = tbe_cache_path(flin)
+    try:
+        with open(flcache, 'wb') as file:
+            np.savez(file, **arrays)
+    except OSError as e:
+        print(f'WARNING: Could not write cache {flcache}: {e}')
+        return None
+    return flcache
+
+
+def from_cache(flin):
+    """
+    Load the tables of a TBE file from its cache file
+
+    Parameters:
+    - flin: File name of the TBE file
+
+    Returns:
+    - Dictionary of tables as returned by ebs_read_tbe, or None if the cache is missing or stale
+    """
+    flcache = tbe_cache_path(flin)
+    if not os.path.isfile(flcache):
+        return None
+    try:
+        with np.load(flcache, allow_pickle=False) as npz:
+            arrays = {key: npz[key] for key in npz.files}
+        metadata = json.loads(arrays['metadata'].item())
+    except (OSError, ValueError, KeyError) as e:
+        print(f'WARNING: Could not read cache {flcache}: {e}')
+        return None
+    if metadata.get('version') != TBE_CACHE_VERSION:
+        return None
+    if metadata.get('signature') != tbe_file_signature(flin):
+        print(f'Cache {flcache} is out of date')
+        return None
+
+    result = {}
+    for tbl_str, table in metadata['tables'].items():
+        if table is None:
+            result[tbl_str] = None
+            continue
+        data = {}
+        for ncol, desc in enumerate(table['columns']):
+            data[desc['name']] = _load_column(arrays, f"{table['key']}/c{ncol}", desc)
+        result[tbl_str] = pd.DataFrame(data, copy=False)
+    return result
@@ -0,0 +1,196 @@
+"""
+Catalog of the TBE files in a directory tree.
+
+build_catalog walks a directory tree for *_tbe.csv files and stores, for each
+file, its Global metadata (strip_header.extract_global_metadata) and the row
+count of each table (tbe_index.read_tbe_index) in a single SQLite database.
+The files are read in parallel in a process pool. Files whose size and
+modification time did not change since the previous build are not read again,
+and files that no longer exist are removed from the catalog.
+
+Tables:
+- files: path, size, mtime_ns, title, source, author, date, comment (from the
+  Global table), ntables, nrecords, error
+- global_metadata: path, variable, value (every Variable/Value of the Global table)
+- tables: path, table_name, ncolumns, nrows
+
+Example query (all inventories for bgd authored after 2023-01-01):
+    query_catalog(catalog_path,
+                  "SELECT path FROM files WHERE title LIKE ? AND date > ?",
+                  ('%bgd', '2023-01-01'))
+
+Run from the repository root:
+python -m python.src.functions.tbe_catalog <directory> <catalog.db> [workers]
+"""
+import os
+import csv
+import sys
+import mmap
+import sqlite3
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .strip_header import extract_global_metadata
+from .tbe_index import read_tbe_index
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+TBE_FILE_SUFFIX = "_tbe.csv"
+GLOBAL_COLUMNS = ("title", "source", "author", "date", "comment")
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER,
+    title TEXT, source TEXT, author TEXT, date TEXT, comment TEXT,
+    ntables INTEGER, nrecords INTEGER, error TEXT
+);
+CREATE TABLE IF NOT EXISTS global_metadata (
+    path TEXT, variable TEXT, value TEXT, PRIMARY KEY (path, variable)
+);
+CREATE TABLE IF NOT EXISTS tables (
+    path TEXT, table_name TEXT, ncolumns INTEGER, nrows INTEGER, PRIMARY KEY (path, table_name)
+);
+CREATE INDEX IF NOT EXISTS files_title ON files (title);
+CREATE INDEX IF NOT EXISTS files_date ON files (date);
+"""
+
+
+def find_tbe_files(root_dir):
+    """
+    Find the TBE files in a directory tree.
+    :param root_dir: Top directory.
+    :return: Sorted list of the absolute paths of the *_tbe.csv files.
+    """
+    tbe_files = []
+    for dirpath, _, filenames in os.walk(root_dir):
+        tbe_files.extend(os.path.abspath(os.path.join(dirpath, filename))
+                         for filename in filenames if filename.endswith(TBE_FILE_SUFFIX))
+    return sorted(tbe_files)
+
+
+def catalog_entry(file_path):
+    """
+    Extract the catalog entry of one TBE file.
+    Runs in the worker processes, so it only returns data.
+    :param file_path: Path to the TBE file.
+    :return: Dictionary with path, size, mtime_ns, global metadata, tables (name, columns, rows) and error.
+    """
+    stat = os.stat(file_path)
+    entry = {
+        "path": file_path,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "global": {},
+        "tables": [],
+        "error": None,
+    }
+    buf = None
+    try:
+        entry["global"], _ = extract_global_metadata(file_path)
+        buf, tbe_index = read_tbe_index(file_path, use_mmap=True)
+        entry["tables"] = [(tbl["name"], len(tbl["columns"]), tbl["nrows"]) for tbl in tbe_index]
+    except (OSError, UnicodeDecodeError, ValueError, csv.Error) as e:
+        # csv.Error: e.g. a field longer than the csv module's field size limit
+        entry["error"] = str(e)
+    finally:
+        if isinstance(buf, mmap.mmap):
+            buf.close()
+    return entry
+
+
+def store_catalog_entry(conn, entry):
+    """
+    Replace the rows of one file in the catalog.
+    :param conn: SQLite connection.
+    :param entry: Dictionary returned by catalog_entry.
+    """
+    path = entry["path"]
+    delete_catalog_file(conn, path)
+    global_meta = {key.lower(): value for key, value in entry["global"].items()}
+    conn.execute(
+        "INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (path, entry["size"], entry["mtime_ns"], *(global_meta.get(column) for column in GLOBAL_COLUMNS),
+         len(entry["tables"]), sum(nrows for _, _, nrows in entry["tables"]), entry["error"]))
+    conn.executemany("INSERT INTO global_metadata VALUES (?, ?, ?)",
+                     [(path, variable, value) for variable, value in entry["global"].items()])
+    conn.executemany("INSERT OR REPLACE INTO tables VALUES (?, ?, ?, ?)",
+                     [(path, name, ncolumns, nrows) for name, ncolumns, nrows in entry["tables"]])
+
+
+def delete_catalog_file(conn, path):
+    """Remove the rows of one file from the catalog."""
+    for table in ("files", "global_metadata", "tables"):
+        conn.execute(f"DELETE FROM {table} WHERE path = ?", (path,))
+
+
+def build_catalog(root_dir, catalog_path, workers=4):
+    """
+    Build or update the catalog of the TBE files in a directory tree.
+    :param root_dir: Top directory.
+    :param catalog_path: Path to the SQLite catalog (created if missing).
+    :param workers: Number of worker processes (1 reads the files in this process).
+    :return: Dictionary with the number of files found, read again and removed.
+    """
+    tbe_files = find_tbe_files(root_dir)
+    conn = sqlite3.connect(catalog_path)
+    try:
+        conn.executescript(CATALOG_SCHEMA)
+        known = {path: (size, mtime_ns) for path, size, mtime_ns in
+                 conn.execute("SELECT path, size, mtime_ns FROM files")}
+
+        changed = []
+        for file_path in tbe_files:
+            stat = os.stat(file_path)
+            if known.get(file_path) != (stat.st_size, stat.st_mtime_ns):
+                changed.append(file_path)
+
+        with conn:
+            if workers > 1 and len(changed) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(catalog_entry, file_path) for file_path in changed]
+                    for future in as_completed(futures):
+                        store_catalog_entry(conn, future.result())
+            else:
+                for file_path in changed:
+                    store_catalog_entry(conn, catalog_entry(file_path))
+
+            found = set(tbe_files)
+            root_prefix = os.path.join(os.path.abspath(root_dir), '')
+            removed = [path for path in known if path.startswith(root_prefix) and path not in found]
+            for path in removed:
+                delete_catalog_file(conn, path)
+    finally:
+        conn.close()
+
+    logger.info(f"Catalog {catalog_path}: {len(tbe_files)} files, {len(changed)} read, {len(removed)} removed")
+    return {"files": len(tbe_files), "read": len(changed), "removed": len(removed)}
+
+
+def query_catalog(catalog_path, sql, params=()):
+    """
+    Run a query on the catalog.
+    :param catalog_path: Path to the SQLite catalog.
+    :param sql: SQL query.
+    :param params: Query parameters.
+    :return: List of rows as dictionaries.
+    """
+    conn = sqlite3.connect(catalog_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return [dict(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python -m python.src.functions.tbe_catalog <directory> <catalog.db> [workers]")
+        sys.exit(1)
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+    build_catalog(sys.argv[1], sys.argv[2], workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,337 @@
+"""
+    Single-pass table boundary index for TBE files
+
+    The file is scanned once for rows that start with a TBE row code
+    (TBL, ATT, BGN, CMT, EOT). Data rows start with a blank first column,
+    so only the code rows are visited; the scan itself runs in the regex
+    engine and scales linearly with the file size.
+
+    Each table in the index is a dictionary holding byte offsets into the
+    scanned buffer:
+    - name: Table name from the TBL row (e.g. 'Global', 'Sites')
+    - columns: Column headers from the TBL row (without the TBL cell)
+    - header: [start, end] of the TBL row
+    - att: List of [start, end] for each ATT row before the data block
+    - cmt: List of [start, end] for each CMT row in the table
+    - data: [start, end] of the data block (BGN row through EOT row)
+    - eot: True if the data block was closed by an EOT row
+    - nrows: Number of data rows in the data block (CMT rows excluded)
+
+    The index can be kept in a '.tbeidx' sidecar file next to the TBE file
+    (JSON, see write_tbe_index). The sidecar is only used while the size,
+    modification time and hash of the first TBE_INDEX_HASH_BYTES bytes of the
+    TBE file still match, so a single table can be read with one seek instead
+    of a scan of the whole file.
+
+    The buffer can be the file content (bytes) or a read-only memory map of the
+    file (read_tbe_index(flin, use_mmap=True)); in both cases the data block of
+    a table is handed to the CSV parser through TbeBlockReader, a file object
+    over a memoryview of the block, so the block itself is never copied.
+    """
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
+import re
+
+import numpy as np
+
+ROW_CODE_PATTERN = re.compile(rb'^(TBL|ATT|BGN|CMT|EOT)[^\n]*(?:\n|$)', re.MULTILINE)
+
+TBE_INDEX_SUFFIX = '.tbeidx'
+TBE_INDEX_VERSION = 1
+TBE_INDEX_HASH_BYTES = 65536
+COUNT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def split_tbe_row(row):
+    """
+    Split one TBE row (bytes or str) into its CSV fields
+
+    Parameters:
+    - row: Single line from a TBE file, with or without line terminator
+
+    Returns:
+    - List of fields, quoted fields unquoted
+    """
+    if isinstance(row, bytes):
+        row = row.decode('utf-8')
+    fields = next(csv.reader([row.rstrip('\r\n')]), [])
+    return fields
+
+
+def count_rows(buf, start, end):
+    """
+    Count the lines in buf[start:end], including a final unterminated line
+
+    Parameters:
+    - buf: Bytes buffer with the file content
+    - start, end: Byte range to count
+
+    Returns:
+    - Number of lines
+    """
+    if end <= start:
+        return 0
+    if isinstance(buf, bytes):
+        nrows = buf.count(b'\n', start, end)
+    else:
+        # Memory map: count on zero-copy NumPy views of the mapped bytes
+        nrows = 0
+        for chunk_start in range(start, end, COUNT_CHUNK_SIZE):
+            chunk_end = min(chunk_start + COUNT_CHUNK_SIZE, end)
+            chunk = np.frombuffer(buf, dtype=np.uint8, count=chunk_end - chunk_start, offset=chunk_start)
+            nrows += int(np.count_nonzero(chunk == ord('\n')))
+    if buf[end - 1:end] != b'\n':
+        nrows += 1
+    return nrows
+
+
+def _is_blank_row(row):
+    """True for empty and delimiter-only rows such as ',,,'"""
+    return not row.strip(b', \t\r\n')
+
+
+def _trim_blank_rows(buf, start, end):
+    """Move end back over blank and delimiter-only rows at the end of a block"""
+    while end > start:
+        line_start = buf.rfind(b'\n', start, end - 1) + 1
+        line_start = max(line_start, start)
+        if not _is_blank_row(buf[line_start:end]):
+            break
+        end = line_start
+    return end
+
+
+def _close_table(buf, table, limit):
+    """Fill in the data block of a table once the next TBL row (or EOF) is known"""
+    if table['data'][0] is None:
+        # No BGN row: data starts after the last ATT row (or the TBL row)
+        table['data'][0] = table['att'][-1][1] if table['att'] else table['header'][1]
+    if table['data'][1] is None:
+        table['data'][1] = _trim_blank_rows(buf, table['data'][0], limit)
+    start, end = table['data']
+    ncmt = sum(1 for cmt_start, _ in table['cmt'] if start <= cmt_start < end)
+    table['nrows'] = max(count_rows(buf, start, end) - ncmt, 0)
+
+
+def scan_tbe_index(buf):
+    """
+    Scan a TBE file buffer once and record the byte ranges of every table
+
+    Parameters:
+    - buf: Bytes buffer with the full content of a TBE file
+
+    Returns:
+    - List of table dictionaries in file order (see module docstring)
+    """
+    tables = []
+    table = None
+
+    for match in ROW_CODE_PATTERN.finditer(buf):
+        code = match.group(1)
+        start, end = match.span()
+
+        if code == b'TBL':
+            if table is not None:
+                _close_table(buf, table, start)
+            fields = split_tbe_row(buf[start:end])
+            table = {
+                'name': fields[0][4:].strip(),
+                'columns': [field.strip() for field in fields[1:]],
+                'header': [start, end],
+                'att': [],
+                'cmt': [],
+                'data': [None, None],
+                'eot': False,
+                'nrows': 0,
+            }
+            tables.append(table)
+        elif table is None:
+            continue
+        elif code == b'ATT':
+            if table['data'][0] is None:
+                table['att'].append([start, end])
+        elif code == b'CMT':
+            table['cmt'].append([start, end])
+        elif code == b'BGN':
+            if table['data'][0] is None:
+                table['data'][0] = start
+        elif code == b'EOT':
+            if table['data'][0] is None:
+                table['data'][0] = table['att'][-1][1] if table['att'] else table['header'][1]
+            if not table['eot']:
+                table['data'][1] = end
+                table['eot'] = True
+
+    if table is not None:
+        _close_table(buf, table, len(buf))
+
+    return tables
+
+
+def read_tbe_index(flin, use_mmap=False):
+    """
+    Read a TBE file once and build its table index
+
+    Parameters:
+    - flin: File name
+    - use_mmap: Map the file read-only instead of reading it into memory; the
+      caller closes the returned mmap once the tables are parsed
+
+    Returns:
+    - buf: Bytes buffer (or mmap) with the file content, index: List of table dictionaries
+    """
+    with open(flin, 'rb') as file:
+        if use_mmap and os.fstat(file.fileno()).st_size > 0:
+            buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            buf = file.read()
+    return buf, scan_tbe_index(buf)
+
+
+class TbeBlockReader(io.RawIOBase):
+    """
+    Read-only binary file object over buf[start:end] (bytes or mmap)
+
+    The range is exposed through a memoryview, so handing a table's data block
+    to pd.read_csv does not copy the block; the parser reads it in chunks.
+    Use it as a context manager so the view is released (required before an
+    mmap can be closed).
+    """
+
+    def __init__(self, buf, start, end):
+        super().__init__()
+        with memoryview(buf) as view:
+            self._view = view[start:end]
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = min(len(b), len(self._view) - self._pos)
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+def tbe_index_path(flin):
+    """Path of the '.tbeidx' sidecar for a TBE file"""
+    return f'{os.fspath(flin)}{TBE_INDEX_SUFFIX}'
+
+
+def tbe_file_signature(flin, head=None):
+    """
+    Signature used to check that a sidecar index still matches its TBE file
+
+    Parameters:
+    - flin: File name
+    - head: First bytes of the file if already in memory (read from flin otherwise)
+
+    Returns:
+    - Dictionary with size, mtime_ns and sha1 of the first TBE_INDEX_HASH_BYTES bytes
+    """
+    stat = os.stat(flin)
+    if head is None:
+        with open(flin, 'rb') as file:
+            head = file.read(TBE_INDEX_HASH_BYTES)
+    return {
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'sha1': hashlib.sha1(head[:TBE_INDEX_HASH_BYTES]).hexdigest(),
+    }
+
+
+def write_tbe_index(flin, buf, tbe_index):
+    """
+    Write the table index of a TBE file to its '.tbeidx' sidecar
+
+    Parameters:
+    - flin: File name of the TBE file
+    - buf: Content of the TBE file (bytes) the index was built from
+    - tbe_index: List of table dictionaries from scan_tbe_index
+
+    Returns:
+    - Path of the sidecar, or None if it could not be written
+    """
+    flidx = tbe_index_path(flin)
+    sidecar = {
+        'version': TBE_INDEX_VERSION,
+        'signature': tbe_file_signature(flin, head=buf),
+        'tables': tbe_index,
+    }
+    try:
+        with open(flidx, 'w') as file:
+            json.dump(sidecar, file)
+    except OSError as e:
+        print(f'WARNING: Could not write index {flidx}: {e}')
+        return None
+    return flidx
+
+
+def load_tbe_index(flin):
+    """
+    Load the table index of a TBE file from its '.tbeidx' sidecar
+
+    Parameters:
+    - flin: File name of the TBE file
+
+    Returns:
+    - List of table dictionaries, or None if the sidecar is missing or stale
+    """
+    flidx = tbe_index_path(flin)
+    if not os.path.isfile(flidx):
+        return None
+    try:
+        with open(flidx, 'r') as file:
+            sidecar = json.load(file)
+    except (OSError, ValueError) as e:
+        print(f'WARNING: Could not read index {flidx}: {e}')
+        return None
+    if sidecar.get('version') != TBE_INDEX_VERSION:
+        return None
+    if sidecar.get('signature') != tbe_file_signature(flin):
+        print(f'Index {flidx} is out of date')
+        return None
+    return sidecar['tables']
+
+
+def read_tbe_table_bytes(flin, tbl_entry, header_only=False):
+    """
+    Read only the bytes of one table (TBL row through end of data) from a TBE file
+
+    Parameters:
+    - flin: File name
+    - tbl_entry: Index entry of the table
+    - header_only: Read only the TBL and ATT rows (for the attributes), not the data block;
+      the data and CMT offsets of the returned entry then point past the end of buf
+
+    Returns:
+    - buf: Bytes of the table, tbl_entry: Copy of the index entry with offsets into buf
+    """
+    start = tbl_entry['header'][0]
+    ends = [tbl_entry['header'][1]] + [att[1] for att in tbl_entry['att']]
+    if not header_only:
+        ends.append(tbl_entry['data'][1])
+    end = max(ends)
+    with open(flin, 'rb') as file:
+        file.seek(start)
+        buf = file.read(end - start)
+
+    def shift(span):
+        return [span[0] - start, span[1] - start]
+
+    tbl_entry = dict(tbl_entry,
+                     header=shift(tbl_entry['header']),
+                     att=[shift(att) for att in tbl_entry['att']],
+                     cmt=[shift(cmt) for cmt in tbl_entry['cmt']],
+                     data=shift(tbl_entry['data']))
+    return buf, tbl_entry
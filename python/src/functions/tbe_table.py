@@ -0,0 +1,266 @@
+"""
+    Columnar table model for TBE files
+
+    A TBETable keeps the data rows of one TBE table as one list per column
+    instead of one dictionary per row, so the header names are stored once per
+    table. After parsing, columns whose ATT Units declare a numeric or boolean
+    type are converted to NumPy arrays, and to_dataframe() hands the columns to
+    pandas without copying them.
+
+    A TBEFile holds the tables of one file in file order. It is produced by
+    read_TBE.read_tbe_file and consumed by the writer (output_TBE), the
+    validation and summary code and ebs_read_tbe (typed DataFrames), so a
+    pipeline parses each file once.
+
+    The mapping from ATT Units to column types (unit_dtype) is shared with
+    ebs_read_tbe, which applies it to the pandas columns it reads
+    (to_typed_series).
+    """
+import re
+
+import numpy as np
+import pandas as pd
+from pytz import all_timezones_set
+
+# ATT Units that declare a column type; see unit_dtype for 'True=...' and 'Time (...)'
+UNIT_DTYPES = {
+    'Name': 'category',
+    'Integer': 'int64',
+    'Number': 'float64',
+    'degrees N': 'float64',
+    'degrees E': 'float64',
+    'hours': 'float64',
+    'ug/m3': 'float64',
+    'ppb': 'float64',
+    'ppm': 'float64',
+    'm/s': 'float64',
+    'degC': 'float64',
+    'hPa': 'float64',
+    '%': 'float64',
+}
+NUMPY_DTYPES = ('int64', 'float64', 'bool')
+TIME_UNITS_PATTERN = re.compile(r'Time\s*\(\s*(.*?)\s*\)')
+TBE_TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+BOOL_VALUES = {'True': True, 'TRUE': True, 'true': True, 'False': False, 'FALSE': False, 'false': False}
+
+
+def unit_dtype(units):
+    """
+    Column type declared by an ATT Units value
+
+    Parameters:
+    - units: Units string from the 'ATT Units' row
+
+    Returns:
+    - 'int64', 'float64', 'bool' ('True=...' units), 'datetime64[ns]' ('Time (zone)' units or
+      a bare IANA time zone name), 'category' ('Name' units), or None if the units do not
+      declare a type
+    """
+    if not units:
+        return None
+    units = units.strip()
+    if units in UNIT_DTYPES:
+        return UNIT_DTYPES[units]
+    if units.startswith('True='):
+        return 'bool'
+    if TIME_UNITS_PATTERN.fullmatch(units) or units in all_timezones_set:
+        return 'datetime64[ns]'
+    return None
+
+
+def unit_time_zone(units):
+    """
+    Time zone declared by the ATT Units of a time column
+
+    Parameters:
+    - units: Units string, 'Time (zone)' or a bare IANA time zone name
+
+    Returns:
+    - zone: Time zone name or None, error: Message if the zone is not a valid IANA name
+    """
+    if not units:
+        return None, None
+    units = units.strip()
+    tzone = TIME_UNITS_PATTERN.fullmatch(units)
+    tzone = tzone.group(1) if tzone else units
+    if tzone in all_timezones_set:
+        return tzone, None
+    if tzone != units:
+        return None, f'Invalid timezone ({tzone})'
+    return None, None
+
+
+def to_typed_column(values, dtype):
+    """
+    Convert a column of strings to a NumPy array of the given dtype
+
+    Integer columns with blank values become float64 with NaN for the blanks.
+
+    Parameters:
+    - values: List of strings
+    - dtype: Target dtype name ('int64', 'float64' or 'bool')
+
+    Returns:
+    - NumPy array, or the input list if the values cannot be converted
+    """
+    if dtype == 'bool':
+        try:
+            return np.array([BOOL_VALUES[value] for value in values], dtype=bool)
+        except KeyError:
+            return values
+    try:
+        return np.array(values, dtype=dtype)
+    except ValueError:
+        pass
+    try:
+        return np.array([value if value != '' else 'nan' for value in values], dtype='float64')
+    except ValueError:
+        return values
+
+
+def to_typed_series(series, dtype):
+    """
+    Convert a column of strings read by pandas to the type declared by its ATT Units
+
+    All conversions are vectorized. Blank values become NaN/NaT; integer columns
+    with blanks or fractional values become float64 (as in to_typed_column). A column is returned unchanged if any non-blank
+    value cannot be converted.
+
+    Parameters:
+    - series: pandas Series of strings
+    - dtype: Column type from unit_dtype, or 'str' (text with blanks as NaN)
+
+    Returns:
+    - Converted Series, or the input Series
+    """
+    blank = series == ''
+    if dtype == 'category':
+        return series.mask(blank).astype('category')
+    if dtype == 'str':
+        return series.mask(blank)
+    if dtype == 'bool':
+        converted = series.map(BOOL_VALUES)
+        if converted.isna().any():
+            return series
+        return converted.astype(bool)
+    if dtype == 'datetime64[ns]':
+        converted = pd.to_datetime(series.mask(blank), format=TBE_TIME_FORMAT, errors='coerce')
+        if converted.isna().sum() > blank.sum():
+            # Not in the standard TBE format, let pandas infer the format once
+            converted = pd.to_datetime(series.mask(blank), errors='coerce')
+        if converted.isna().sum() > blank.sum():
+            return series
+        return converted.astype('datetime64[ns]')
+    converted = pd.to_numeric(series.mask(blank), errors='coerce')
+    if converted.isna().sum() > blank.sum():
+        return series
+    if dtype == 'int64' and not blank.any() and (converted % 1 == 0).all():
+        return converted.astype('int64')
+    return converted.astype('float64')
+
+
+class TBETable:
+    """
+    Data rows of one TBE table stored by column
+
+    Attributes:
+    - name: Table name from the TBL row
+    - headers: Column headers from the TBL row
+    - att: Dictionary of ATT rows, attribute name -> list of values per column
+    - cmt: Dictionary of CMT rows, comment type -> list of values
+    - columns: One list (or NumPy array once typed) per header
+    - eot_name: Name on the EOT row if it differs from the table name, else None
+    """
+    __slots__ = ('name', 'headers', 'att', 'cmt', 'columns', 'eot_name')
+
+    def __init__(self, name, headers, att=None, cmt=None):
+        self.name = name
+        self.headers = list(headers)
+        self.att = {} if att is None else att
+        self.cmt = {} if cmt is None else cmt
+        self.columns = [[] for _ in self.headers]
+        self.eot_name = None
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __repr__(self):
+        return f"TBETable {self.name}: {len(self)} rows x {len(self.headers)} columns"
+
+    def append_row(self, values):
+        """Append one data row (values without the row code cell), padding short rows"""
+        ncols = len(self.columns)
+        if len(values) < ncols:
+            values = list(values) + [''] * (ncols - len(values))
+        for column, value in zip(self.columns, values):
+            column.append(value.strip())
+
+    def units(self):
+        """ATT Units of each column ('' where not given)"""
+        units = self.att.get('Units', [])
+        return [units[i] if i < len(units) else '' for i in range(len(self.headers))]
+
+    def convert_types(self):
+        """Convert the columns whose ATT Units declare a numeric or boolean type to NumPy arrays"""
+        for i, units in enumerate(self.units()):
+            dtype = unit_dtype(units)
+            if dtype in NUMPY_DTYPES and isinstance(self.columns[i], list):
+                self.columns[i] = to_typed_column(self.columns[i], dtype)
+        return self
+
+    def column(self, header):
+        """Values of the column with the given header"""
+        return self.columns[self.headers.index(header)]
+
+    def to_dataframe(self):
+        """DataFrame with one column per (non-empty) header, typed columns are not copied"""
+        data = {header: column for header, column in zip(self.headers, self.columns) if header}
+        return pd.DataFrame(data, copy=False)
+
+
+class TBEFile:
+    """
+    Tables of one TBE file in file order
+
+    Attributes:
+    - path: File the tables were read from (None for tables built in memory)
+    - tables: Dictionary table name -> TBETable
+    """
+    __slots__ = ('path', 'tables')
+
+    def __init__(self, path=None, tables=None):
+        self.path = path
+        self.tables = {}
+        for table in tables or []:
+            self.add_table(table)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __iter__(self):
+        return iter(self.tables.values())
+
+    def __contains__(self, name):
+        return name in self.tables
+
+    def __getitem__(self, name):
+        return self.tables[name]
+
+    def __repr__(self):
+        return f"TBEFile {self.path}: " + ", ".join(repr(table) for table in self)
+
+    def add_table(self, table):
+        """Add a table (a later table with the same name replaces an earlier one)"""
+        self.tables[table.name] = table
+        return table
+
+    def global_metadata(self):
+        """Variable -> Value pairs of the Global table ({} if there is none)"""
+        table = self.tables.get('Global')
+        if table is None or len(table.columns) < 2:
+            return {}
+        return dict(zip(table.columns[0], table.columns[1]))
+
+    def to_dict(self):
+        """Tables as {name: {'data': TBETable, 'att': ..., 'cmt': ...}} (the read_TBE.parse_tbe structure)"""
+        return {table.name: {'data': table, 'att': table.att, 'cmt': table.cmt} for table in self}
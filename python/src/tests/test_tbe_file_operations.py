@@ -1,8 +1,30 @@
 import pytest
 import os
 import pandas as pd
+import numpy as np
 import csv
+import shutil
+from python.src.functions.bdf_utils import (AttributeIndex, get_attribute, get_attribute_check, saq_sitename2id,
+                                            saq_sitenames2ids)
+from c.src.functions.c_tbe_integration import TbeBatchProcessor
+from python.src.functions import ebs_read_tbe as ebs_read_tbe_module
 from python.src.functions.ebs_read_tbe import ebs_read_tbe
+from python.src.functions import read_directory
+from python.src.functions.read_directory import process_csv_files
+from python.src.functions.output_columnar import export_tbl_columnar, read_tbl_columnar
+from python.src.functions.output_TBE import TbeWriter, export_to_tbe
+from python.src.functions import scan_manifest
+from python.src.functions.scan_manifest import ScanManifest
+from python.src.functions.strip_header import extract_global_metadata, extract_global_metadata_many
+from python.src.functions.tbe_cache import from_cache, tbe_cache_path
+from python.src.functions.tbe_catalog import build_catalog, query_catalog
+from python.src.functions.tbe_index import TbeBlockReader, load_tbe_index, read_tbe_index, tbe_index_path
+from python.src.functions.isolate_header import Attribute, TBEHeader, TBLSection, parse_tbe_header
+from python.src.functions.pm25_aggregate import aggregate_pm25
+from python.src.functions.level1_ingest import (Level1Deduplicator, apply_pm25_scale, find_level1_files, r_column_name,
+                                               read_level1_files, read_level1_sites)
+from python.src.functions.read_TBE import iter_rows, iter_tables, parse_tbe, read_tbe_file
+from python.src.functions.tbe_table import TBEFile, TBETable, to_typed_series, unit_dtype
 
 
 def test_read_tbe_file_valid():
@@ -138,6 +160,663 @@ def test_automated_testing_setup():
     """Test for automated setup, ensuring that all tests run successfully."""
     assert True  # A simple test that always passes to ensure setup is correct
 
+def test_tbe_index_single_pass_boundaries(tmp_path):
+    """Test that the table index finds every table block and its data rows."""
+    flin = tmp_path / 'index_tbe.csv'
+    flin.write_text(
+        "TBL Global,Variable,Value\n"
+        "BGN,Title,Test\n"
+        "EOT Global,Author,someone\n"
+        ",,,\n"
+        "TBL Sites,siteid,latitude\n"
+        "ATT Units,Name,degrees N\n"
+        "BGN,a,1.5\n"
+        "CMT,note,skipped\n"
+        ",b,2.5\n"
+        "EOT Sites,c,3.5\n"
+    )
+    buf, tbe_index = read_tbe_index(flin)
+    assert [tbl['name'] for tbl in tbe_index] == ['Global', 'Sites']
+    assert tbe_index[1]['columns'] == ['siteid', 'latitude']
+    assert [tbl['nrows'] for tbl in tbe_index] == [2, 3]
+    assert all(tbl['eot'] for tbl in tbe_index)
+    start, end = tbe_index[1]['data']
+    assert buf[start:end].startswith(b'BGN,a') and buf[start:end].endswith(b'3.5\n')
+
+    result = ebs_read_tbe(flin=str(flin), flsource='', tblselect=None)['result']
+    assert result['global']['Variable'].tolist() == ['Title', 'Author']
+    assert result['sites']['siteid'].tolist() == ['a', 'b', 'c']
+    assert result['tc_sites'].set_index('Variable').loc['latitude', 'Units'] == 'degrees N'
+    assert result['tc_global'] is None
+
+def test_tbe_index_missing_eot(tmp_path):
+    """Test that a table without EOT ends at the last non-blank row before the next TBL."""
+    flin = tmp_path / 'noeot_tbe.csv'
+    flin.write_text(
+        "TBL First,x,y\n"
+        "BGN,1,2\n"
+        ",3,4\n"
+        ",,\n"
+        "TBL Second,z\n"
+        "BGN,5\n"
+    )
+    _, tbe_index = read_tbe_index(flin)
+    assert [tbl['nrows'] for tbl in tbe_index] == [2, 1]
+    assert not tbe_index[0]['eot']
+
+def test_ebs_read_tbe_sample_sites():
+    """Test that the Sites table of the sample inventories is read in full."""
+    flin = './sample_data/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv'
+    result = ebs_read_tbe(flin=flin, flsource='', tblselect='sites')['result']
+    assert 'global' not in result
+    assert result['sites'].shape == (75, 17)
+    assert result['sites']['siteid'].iloc[0] == 'bgd_1_siddeshwari'
+
+def test_tbe_index_sidecar(tmp_path):
+    """Test that the .tbeidx sidecar is written, reused for tblselect and invalidated on change."""
+    flin = tmp_path / 'sidecar_tbe.csv'
+    shutil.copy('./sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv', flin)
+    expected = ebs_read_tbe(flin=str(flin), flsource='', tblselect='sites')['result']['sites']
+
+    first = ebs_read_tbe(flin=str(flin), flsource='', tblselect='sites', use_index=True)['result']
+    assert os.path.isfile(tbe_index_path(flin))
+    tbe_index = load_tbe_index(flin)
+    assert [tbl['name'] for tbl in tbe_index] == ['Global', 'Sites']
+    assert tbe_index[1]['nrows'] == 57
+
+    second = ebs_read_tbe(flin=str(flin), flsource='', tblselect='sites', use_index=True)['result']
+    pd.testing.assert_frame_equal(first['sites'], expected)
+    pd.testing.assert_frame_equal(second['sites'], expected)
+    pd.testing.assert_frame_equal(second['tc_sites'], first['tc_sites'])
+
+    with open(flin, 'a') as f:
+        f.write('CMT,appended\n')
+    assert load_tbe_index(flin) is None
+
+def test_iter_tables_streams_batches():
+    """Test that iter_tables yields each table with its attributes and bounded row batches."""
+    flin = './sample_data/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv'
+    nrows = {}
+    for table_name, headers, att_data, batches in iter_tables(flin, batch_size=10):
+        sizes = [len(batch) for batch in batches]
+        assert all(size <= 10 for size in sizes)
+        nrows[table_name] = sum(sizes)
+        if table_name == 'Sites':
+            assert headers[2] == 'siteid'
+            assert att_data['Units'][5] == 'degrees N'
+    assert nrows == {'Global': 7, 'Sites': 75}
+
+def test_iter_rows_single_table():
+    """Test that iter_rows streams only the selected table and skips unconsumed tables."""
+    flin = './sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
+    batches = list(iter_rows(flin, 'sites', batch_size=20))
+    assert [len(batch) for batch in batches] == [20, 20, 17]
+    assert batches[0][0][2] == 'npl_bhairahawa_amc'
+    assert batches[-1][-1][2] == 'npl_tokha'
+
+def test_parse_tbe_columnar_tables():
+    """Test that parse_tbe stores rows by column and types columns from ATT Units."""
+    flin = './sample_data/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv'
+    tables = parse_tbe(flin)
+    sites = tables['Sites']['data']
+    assert isinstance(sites, TBETable)
+    assert len(sites) == 75
+    assert len(tables['Global']['data']) == 7
+    assert sites.column('serial_number').dtype == np.int64
+    assert sites.column('latitude').dtype == np.float64
+    assert sites.column('siteid')[0] == 'bgd_1_siddeshwari'
+    assert tables['Sites']['att']['Units'][0] == 'Name'
+
+    df = sites.to_dataframe()
+    assert df.shape == (75, 17)
+    assert np.shares_memory(df['latitude'].to_numpy(), sites.column('latitude'))
+
+def test_tbe_table_blank_integer_values():
+    """Test that integer columns with blank values fall back to float with NaN."""
+    table = TBETable('Test', ['n', 'name'], att={'Units': ['Integer', 'Name']})
+    table.append_row(['1', 'a'])
+    table.append_row(['', 'b'])
+    table.append_row(['3'])
+    table.convert_types()
+    assert table.column('n').dtype == np.float64
+    assert np.isnan(table.column('n')[1])
+    assert table.column('name') == ['a', 'b', '']
+
+def test_ebs_read_tbe_unit_dtypes():
+    """Test that ATT Units drive the column types of the data read by ebs_read_tbe."""
+    flin = './sample_data/saq_bluesky_dku_20210715_20230131_inv_tbe.csv'
+    sites = ebs_read_tbe(flin=flin, flsource='', tblselect='sites')['result']['sites']
+    assert sites['serial_number'].dtype == np.int64
+    assert sites['latitude'].dtype == np.float64
+    assert sites['is_indoors'].dtype == bool
+    assert isinstance(sites['siteid'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(sites['date_start'])
+
+def test_unit_dtype_mapping():
+    """Test the ATT Units to column type mapping and its fallbacks."""
+    assert unit_dtype('Integer') == 'int64'
+    assert unit_dtype('degrees N') == 'float64'
+    assert unit_dtype('True=inside') == 'bool'
+    assert unit_dtype('Time (Etc/UTC)') == 'datetime64[ns]'
+    assert unit_dtype('IANA tzdata') is None
+    assert to_typed_series(pd.Series(['1', '', '3']), 'int64').tolist()[::2] == [1.0, 3.0]
+    assert to_typed_series(pd.Series(['1', 'x']), 'float64').tolist() == ['1', 'x']
+    names = to_typed_series(pd.Series(['a', '', 'b']), 'category')
+    assert list(names.cat.categories) == ['a', 'b'] and names.isna().tolist() == [False, True, False]
+    # Fractional values in an Integer column are not truncated
+    assert to_typed_series(pd.Series(['1', '1.5']), 'int64').tolist() == [1.0, 1.5]
+    assert to_typed_series(pd.Series(['1', '2']), 'int64').dtype == 'int64'
+
+def test_ebs_read_tbe_time_zones(tmp_path):
+    """Test that time columns are localized in the zone declared by their ATT Units."""
+    flin = tmp_path / 'time_tbe.csv'
+    flin.write_text(
+        "TBL Timeseries,date,date_local,pm25\n"
+        "ATT Units,Time (Etc/UTC),Asia/Dhaka,ug/m3\n"
+        "BGN,2021-10-01 00:00:00,2021-10-01 06:00:00,10.5\n"
+        "EOT Timeseries,2021-10-01 01:00:00,2021-10-01 07:00:00,\n"
+    )
+    tb = ebs_read_tbe(flin=str(flin), flsource='', tblselect=None)['result']['timeseries']
+    assert str(tb['date'].dt.tz) == 'Etc/UTC'
+    assert str(tb['date_local'].dt.tz) == 'Asia/Dhaka'
+    assert (tb['date_local'].dt.tz_convert('UTC') == tb['date'].dt.tz_convert('UTC')).all()
+    assert np.isnan(tb['pm25'].iloc[1])
+
+def test_ebs_read_tbe_daylight_saving(tmp_path, capsys):
+    """Test that the repeated clock hour at the end of daylight saving time is inferred from the row order."""
+    flin = tmp_path / 'dst_tbe.csv'
+    flin.write_text(
+        "TBL Timeseries,date_local,pm25\n"
+        "ATT Units,America/New_York,ug/m3\n"
+        "BGN,2022-11-06 00:30:00,1\n"
+        ",2022-11-06 01:30:00,2\n"
+        ",2022-11-06 01:30:00,3\n"
+        "EOT Timeseries,2022-11-06 02:30:00,4\n"
+    )
+    tb = ebs_read_tbe(flin=str(flin), flsource='', tblselect=None)['result']['timeseries']
+    assert tb['date_local'].notna().all()
+    assert tb['date_local'].diff().iloc[1:].tolist() == [pd.Timedelta('1h')] * 3
+    assert '0 ambiguous or nonexistent times in column date_local set to NaT' in capsys.readouterr().out
+
+    # Out of time order the repeated hour cannot be inferred
+    flin.write_text(
+        "TBL Timeseries,date_local,pm25\n"
+        "ATT Units,America/New_York,ug/m3\n"
+        "BGN,2022-11-06 01:30:00,1\n"
+        "EOT Timeseries,2022-11-06 00:30:00,2\n"
+    )
+    tb = ebs_read_tbe(flin=str(flin), flsource='', tblselect=None)['result']['timeseries']
+    assert tb['date_local'].isna().tolist() == [True, False]
+    assert '1 ambiguous or nonexistent times in column date_local set to NaT' in capsys.readouterr().out
+
+def test_attribute_index_lookup():
+    """Test that AttributeIndex returns the same results and errors as get_attribute_check."""
+    tc = pd.DataFrame({
+        'Variable': ['date', 'pm25', 'pm25'],
+        'Units': ['Asia/Dhaka', 'ug/m3', 'ug/m3'],
+        'DisplayName': ['Local Time', 'PM2.5', 'PM2.5 (dup)'],
+    })
+    tc_index = AttributeIndex(tc)
+    assert tc_index.get_attribute_check('date', 'Units') == {'result': 'Asia/Dhaka', 'error': None}
+    assert tc_index.get_attribute_check('pm25', 'Units')['error'].startswith('Found multiple (2) entries')
+    assert tc_index.get_attribute_check('pm10', 'Units')['error'].startswith('Could not find entry for pm10')
+    assert tc_index.get_attribute_check('date', 'Scale')['error'].startswith('Could not find attribute Scale')
+    assert get_attribute_check(tc_index, 'date', 'DisplayName') == get_attribute_check(tc, 'date', 'DisplayName')
+    assert get_attribute(tc_index, 'pm10', 'Units') == ''
+    assert AttributeIndex(None).get_attribute('date', 'Units') == ''
+
+def test_batch_processor_parallel_summaries():
+    """Test that parallel and serial batch processing give the same per-file table summaries."""
+    serial = TbeBatchProcessor(workers=1)
+    serial_summaries = serial.process_tbe_directory('./sample_data')
+    parallel = TbeBatchProcessor(workers=2)
+    parallel_summaries = parallel.process_tbe_directory('./sample_data')
+    assert parallel_summaries == serial_summaries
+    assert parallel.processed_files == serial.processed_files == 3
+    assert parallel.total_records == serial.total_records
+    bgd = [s for s in parallel_summaries if s['file'].endswith('bgd_20211001_20230430_inv_tbe.csv')][0]
+    assert {table['name']: table['records'] for table in bgd['tables']} == {'Global': 7, 'Sites': 75}
+
+def test_batch_processor_manifest_signature_from_workers(tmp_path, monkeypatch):
+    """Test that the manifest stores the signature computed where the file is parsed, without hashing it again."""
+    def no_rehash(file_path):
+        raise AssertionError(f'{file_path} hashed again by the manifest')
+    monkeypatch.setattr(scan_manifest, 'file_signature', no_rehash)
+    manifest_path = str(tmp_path / 'manifest.json')
+    processor = TbeBatchProcessor(workers=2, manifest_path=manifest_path)
+    summaries = processor.process_tbe_directory('./sample_data')
+    assert processor.processed_files == 3
+    assert all('signature' not in file_summary for file_summary in summaries)
+    manifest = ScanManifest(manifest_path)
+    for file_summary in summaries:
+        entry = manifest.entries[os.path.abspath(file_summary['file'])]
+        assert entry['size'] == os.path.getsize(file_summary['file'])
+        assert len(entry['sha1']) == 40 and entry['data'] == file_summary
+
+def test_scan_manifest_incremental(tmp_path, monkeypatch):
+    """Test that repeat scans with a manifest only reparse new or changed files."""
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    for file in os.listdir('./sample_data'):
+        shutil.copy(os.path.join('./sample_data', file), data_dir / file)
+    manifest_path = str(tmp_path / 'manifest.json')
+
+    first = process_csv_files(data_dir, manifest_path=manifest_path)
+    manifest = ScanManifest(manifest_path)
+    assert len(manifest.entries) == 3
+
+    changed = data_dir / 'saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
+    with open(changed, 'a') as f:
+        f.write(',extra,row\n')
+    os.utime(data_dir / 'saq_bluesky_bgd_20211001_20230430_inv_tbe.csv', ns=(0, 0))
+    manifest = ScanManifest(manifest_path)
+    assert manifest.lookup(changed) is None
+    assert manifest.lookup(data_dir / 'saq_bluesky_bgd_20211001_20230430_inv_tbe.csv') is not None
+
+    parsed = []
+    original_extract = read_directory.extract_metadata
+    monkeypatch.setattr(read_directory, 'extract_metadata',
+                        lambda file: parsed.append(file.name) or original_extract(file))
+    second = process_csv_files(data_dir, manifest_path=manifest_path)
+    assert parsed == [changed.name]
+    rows = {m['file_name']: m['row_count'] for m in second}
+    assert rows[changed.name] == {m['file_name']: m['row_count'] for m in first}[changed.name] + 1
+
+    processor = TbeBatchProcessor(manifest_path=str(tmp_path / 'batch_manifest.json'))
+    summaries = processor.process_tbe_directory(str(data_dir))
+    rerun = TbeBatchProcessor(manifest_path=str(tmp_path / 'batch_manifest.json'))
+    assert rerun.reuse_unchanged_summaries([s['file'] for s in summaries]) == []
+    assert rerun.total_records == processor.total_records
+
+def test_extract_metadata_streaming(tmp_path):
+    """Test that extract_metadata counts rows across chunks without reading the file into memory."""
+    flin = tmp_path / 'large.csv'
+    with open(flin, 'w') as f:
+        f.write('a,b\n')
+        for i in range(1000):
+            f.write(f'{i},{i * 2}\n')
+        f.write('last,row')
+    metadata = read_directory.extract_metadata(flin)
+    assert metadata['row_count'] == 1001
+    assert metadata['column_names'] == ['a', 'b']
+    assert metadata['sample_data'] == ['0,0\n', '1,2\n', '2,4\n', '3,6\n', '4,8\n']
+
+    with open(flin, 'rb') as f:
+        f.readline()
+        assert read_directory.count_remaining_lines(f) == 1001
+
+def test_mmap_readers_match_buffered_readers():
+    """Test that the memory-mapped reader modes return the same tables as the default modes."""
+    flin = './sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
+    expected = ebs_read_tbe(flin=flin, flsource='', tblselect=None)['result']
+    mapped = ebs_read_tbe(flin=flin, flsource='', tblselect=None, use_mmap=True)['result']
+    assert expected.keys() == mapped.keys()
+    pd.testing.assert_frame_equal(mapped['sites'], expected['sites'])
+    pd.testing.assert_frame_equal(mapped['global'], expected['global'])
+
+    tables = parse_tbe(flin)
+    mapped_tables = parse_tbe(flin, use_mmap=True)
+    for table_name, table_data in tables.items():
+        pd.testing.assert_frame_equal(mapped_tables[table_name]['data'].to_dataframe(),
+                                      table_data['data'].to_dataframe())
+        assert mapped_tables[table_name]['att'] == table_data['att']
+
+def test_tbe_block_reader_view(tmp_path):
+    """Test that TbeBlockReader reads a byte range of a memory map and releases it on close."""
+    flin = tmp_path / 'block_tbe.csv'
+    flin.write_bytes(b"TBL T,a\nBGN,1\n,2\nEOT T,3\n")
+    buf, tbe_index = read_tbe_index(flin, use_mmap=True)
+    assert tbe_index[0]['nrows'] == 3
+    with TbeBlockReader(buf, *tbe_index[0]['data']) as block:
+        assert block.read() == b"BGN,1\n,2\nEOT T,3\n"
+    buf.close()
+
+def test_ebs_read_tbe_chunks(tmp_path, capsys, monkeypatch):
+    """Test that chunksize yields typed chunks without CMT rows that add up to the full table."""
+    flin = tmp_path / 'chunks_tbe.csv'
+    flin.write_text(
+        "TBL Data,time,value,site\n"
+        "ATT Units,Time (Etc/UTC),Integer,Name\n"
+        "BGN,2023-01-01 00:00:00,1,a\n"
+        ",2023-01-01 01:00:00,2,b\n"
+        "CMT,note,,\n"
+        ",2023-01-01 02:00:00,3,\n"
+        "EOT Data,2023-01-01 03:00:00,,a\n"
+    )
+    capsys.readouterr()
+    chunks = list(ebs_read_tbe(flin=str(flin), flsource='', chunksize=2)['result']['data'])
+    # The time zone is resolved and reported once per table, not per chunk
+    out = capsys.readouterr().out
+    assert out.count('Found valid time and timezone (Etc/UTC) for column time') == 1
+    assert out.count('0 ambiguous or nonexistent times in column time set to NaT') == 1
+    assert [len(chunk) for chunk in chunks] == [2, 1, 1]
+    # Every chunk has the same types: Integer as float64 (blank in the last chunk), Name as text
+    assert all(chunk['value'].dtype == 'float64' for chunk in chunks)
+    assert len({str(chunk['site'].dtype) for chunk in chunks}) == 1
+    assert str(chunks[0]['time'].dt.tz) == 'Etc/UTC'
+    tf_all = pd.concat(chunks)
+    assert tf_all['value'].tolist()[:3] == [1, 2, 3] and np.isnan(tf_all['value'].iloc[3])
+    assert tf_all['site'].isna().tolist() == [False, False, True, False]
+    assert tf_all['site'].dropna().tolist() == ['a', 'b', 'a']
+
+    # With a fresh sidecar index only the TBL and ATT rows are read besides the chunks
+    read_sizes = []
+    original_read_table_bytes = ebs_read_tbe_module.read_tbe_table_bytes
+    def read_table_bytes(flin, tbl_entry, header_only=False):
+        tbl_buf, tbl_entry = original_read_table_bytes(flin, tbl_entry, header_only)
+        read_sizes.append(len(tbl_buf))
+        return tbl_buf, tbl_entry
+    ebs_read_tbe(flin=str(flin), flsource='', use_index=True)
+    monkeypatch.setattr(ebs_read_tbe_module, 'read_tbe_table_bytes', read_table_bytes)
+    chunks = list(ebs_read_tbe(flin=str(flin), flsource='', use_index=True, chunksize=2)['result']['data'])
+    assert read_sizes == [len("TBL Data,time,value,site\nATT Units,Time (Etc/UTC),Integer,Name\n")]
+    pd.testing.assert_frame_equal(pd.concat(chunks).reset_index(drop=True), tf_all.reset_index(drop=True))
+
+def test_export_tbl_columnar_round_trip(tmp_path):
+    """Test that Parquet/Arrow exports keep the typed data, ATT rows and Global metadata."""
+    pytest.importorskip('pyarrow')
+    flin = './sample_data/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv'
+    expected = ebs_read_tbe(flin=flin, flsource='', tblselect='sites')['result']['sites']
+    for fmt in ('parquet', 'arrow'):
+        output_files = export_tbl_columnar(flin, str(tmp_path), fmt=fmt)
+        assert [os.path.basename(f) for f in output_files] == [f'global_data.{fmt}', f'sites_data.{fmt}']
+        sites = read_tbl_columnar(output_files[1])
+        pd.testing.assert_frame_equal(sites['data'], expected)
+        assert sites['att']['latitude']['Units'] == 'degrees N'
+        assert sites['global']['Title'] == 'Inventory for bgd'
+
+def test_export_to_tbe_round_trip(tmp_path):
+    """Test that a sample file written by export_to_tbe reads back to the same tables."""
+    flin = './sample_data/saq_bluesky_npl_20220830_20230404_inv_tbe.csv'
+    tables = parse_tbe(flin)
+    flout = tmp_path / 'roundtrip_tbe.csv'
+    export_to_tbe(tables, flout)
+    reread = parse_tbe(flout)
+    assert reread.keys() == tables.keys()
+    for table_name, table_data in tables.items():
+        pd.testing.assert_frame_equal(reread[table_name]['data'].to_dataframe(),
+                                      table_data['data'].to_dataframe())
+        assert reread[table_name]['att'] == table_data['att']
+    with open(flin) as f_in, open(flout) as f_out:
+        assert f_out.readline() == f_in.readline()
+
+def test_tbe_writer_streams_rows(tmp_path):
+    """Test that TbeWriter writes generated rows in canonical TBL/ATT/BGN/EOT order."""
+    flout = tmp_path / 'stream_tbe.csv'
+    with TbeWriter(flout) as writer:
+        nrows = writer.write_table('Data', ['x', 'y'], ((str(i), str(i * i)) for i in range(3)),
+                                   att={'Units': ['Integer', 'Integer']})
+        writer.write_table('Meta', ['key'], iter([('a',)]))
+    assert nrows == 3
+    assert flout.read_text() == ("TBL Data,x,y\nATT Units,Integer,Integer\nBGN,0,0\n,1,1\nEOT Data,2,4\n"
+                                 ",,,\nTBL Meta,key\nEOT Meta,a\n")
+
+def test_ebs_read_tbe_cache(tmp_path):
+    """Test that the binary cache returns the same typed tables and is ignored once stale."""
+    flin = tmp_path / 'cached_tbe.csv'
+    shutil.copy('./sample_data/saq_bluesky_bgd_20211001_20230430_inv_tbe.csv', flin)
+    expected = ebs_read_tbe(flin=str(flin), flsource='', use_cache=True)['result']
+    assert os.path.isfile(tbe_cache_path(flin))
+
+    cached = from_cache(flin)
+    assert cached.keys() == expected.keys()
+    assert cached['tc_global'] is None
+    for key, tbl in expected.items():
+        if tbl is not None:
+            pd.testing.assert_frame_equal(cached[key], tbl)
+    selected = ebs_read_tbe(flin=str(flin), flsource='', tblselect='sites', use_cache=True)['result']
+    assert list(selected) == ['sites', 'tc_sites']
+
+    with open(flin, 'a') as f:
+        f.write(',,,\n')
+    assert from_cache(flin) is None
+
+def test_tbe_file_model_round_trip(tmp_path):
+    """Test that read_tbe_file builds one TBEFile shared by parse_tbe and the writer."""
+    flin = './sample_data/saq_bluesky_dku_20210715_20230131_inv_tbe.csv'
+    tbe_file = read_tbe_file(flin)
+    assert isinstance(tbe_file, TBEFile)
+    assert [table.name for table in tbe_file] == ['Global', 'Sites']
+    assert tbe_file['Sites'].eot_name == 'Timeseries'
+    assert tbe_file.global_metadata()['Title'] == 'Inventory for dku'
+    assert read_tbe_file(flin, use_mmap=True)['Sites'].eot_name == 'Timeseries'
+    assert parse_tbe(flin).keys() == tbe_file.to_dict().keys()
+
+    flout = tmp_path / 'model_tbe.csv'
+    export_to_tbe(tbe_file, flout)
+    with open(flin) as f_in, open(flout) as f_out:
+        assert f_out.read() == f_in.read()
+
+def test_isolate_header_slots():
+    """Test that the header records of isolate_header use __slots__ instead of instance dicts."""
+    for record in (Attribute('Title', 'x'), TBLSection('Sites'), TBEHeader()):
+        assert not hasattr(record, '__dict__')
+
+def test_parse_tbe_header_header_only(tmp_path):
+    """Test that the header-only mode keeps the TBL/ATT/BGN/EOT rows and skips the data rows."""
+    flin = tmp_path / 'header_tbe.csv'
+    flin.write_text(
+        "TBL Global,Variable,Value\n"
+        "BGN,Title,Inventory\n"
+        + "".join(f",InputFile{i},file{i}.csv\n" for i in range(1000))
+        + "EOT Global,InputFile1000,file1000.csv\n"
+        ",,,\n"
+        "TBL Sites,siteid,latitude\n"
+        "ATT Units,Name,degrees N\n"
+        "BGN,s1,1.5\n"
+        ",s2,2.5\n"
+        "EOT Sites,s3,3.5\n"
+    )
+    full = parse_tbe_header(str(flin))
+    header = parse_tbe_header(str(flin), header_only=True)
+    assert len(full.bgn_attributes) == 1003
+    assert [(a.name, a.value) for a in header.bgn_attributes] == [('Title', 'Inventory'), ('s1', '1.5')]
+    assert [(a.name, a.value) for a in header.eot_attributes] == [('InputFile1000', 'file1000.csv'), ('s3', '3.5')]
+    assert repr(header.sections) == repr(full.sections)
+
+def test_extract_global_metadata_early_exit(tmp_path):
+    """Test that Global metadata is read with quoted values and reading stops at the end of the table."""
+    flin = tmp_path / 'global_tbe.csv'
+    flin.write_text(
+        "TBL Global,Variable,Value\n"
+        "BGN,Title,\"Inventory, bgd\"\n"
+        ",Author,bdefoy\n"
+        "EOT Global,InputFile1,Level1.csv\n"
+        ",,,\n"
+        "TBL Sites,siteid\n"
+        "BGN,\"unterminated\n"
+    )
+    metadata, warning = extract_global_metadata(str(flin))
+    assert warning is None
+    assert metadata == {'Title': 'Inventory, bgd', 'Author': 'bdefoy', 'InputFile1': 'Level1.csv'}
+
+    results = extract_global_metadata_many([str(flin), str(tmp_path / 'missing.csv')], workers=2)
+    assert results[str(flin)] == (metadata, None)
+    assert results[str(tmp_path / 'missing.csv')][0] == {}
+
+def test_build_catalog_incremental(tmp_path):
+    """Test that the catalog answers metadata queries and only rereads changed files."""
+    for name in ('saq_bluesky_bgd_20211001_20230430_inv_tbe.csv', 'saq_bluesky_npl_20220830_20230404_inv_tbe.csv'):
+        subdir = tmp_path / 'archive' / name[12:15]
+        subdir.mkdir(parents=True)
+        shutil.copy(os.path.join('./sample_data', name), subdir / name)
+    catalog_path = str(tmp_path / 'catalog.db')
+
+    assert build_catalog(str(tmp_path / 'archive'), catalog_path, workers=2) == {'files': 2, 'read': 2, 'removed': 0}
+    rows = query_catalog(catalog_path, "SELECT path, nrecords FROM files WHERE title LIKE ? AND date > ?",
+                         ('%bgd', '2023-01-01'))
+    assert len(rows) == 1 and rows[0]['path'].endswith('bgd_20211001_20230430_inv_tbe.csv')
+    assert rows[0]['nrecords'] == 82
+    sites = query_catalog(catalog_path, "SELECT nrows FROM tables WHERE table_name = 'Sites' ORDER BY nrows")
+    assert [row['nrows'] for row in sites] == [57, 75]
+
+    assert build_catalog(str(tmp_path / 'archive'), catalog_path, workers=1)['read'] == 0
+    os.remove(tmp_path / 'archive' / 'npl' / 'saq_bluesky_npl_20220830_20230404_inv_tbe.csv')
+    assert build_catalog(str(tmp_path / 'archive'), catalog_path)['removed'] == 1
+    assert query_catalog(catalog_path, "SELECT COUNT(*) AS n FROM global_metadata WHERE path LIKE '%npl%'")[0]['n'] == 0
+
+    # A Global value over the csv field size limit is recorded as an error instead of failing the build
+    (tmp_path / 'archive' / 'bad_tbe.csv').write_text(
+        "TBL Global,Variable,Value\nBGN,Title,\"" + "x" * 200000 + "\"\nEOT Global,Author,bdefoy\n")
+    for workers in (1, 2):
+        assert build_catalog(str(tmp_path / 'archive'), catalog_path, workers=workers)['files'] == 2
+        rows = query_catalog(catalog_path, "SELECT path, error FROM files WHERE path LIKE '%bad_tbe.csv'")
+        assert len(rows) == 1 and 'field larger than field limit' in rows[0]['error']
+        os.utime(tmp_path / 'archive' / 'bad_tbe.csv', ns=(0, workers))
+
+def test_saq_sitenames2ids_vectorized():
+    """Test that the vectorized siteid generation matches saq_sitename2id and keeps the index."""
+    names = pd.Series(["Cox's Bazar School", "University of Dhaka Campus", None, "Cox's Bazar School"],
+                      index=[10, 11, 12, 13], name='sitename')
+    siteids = saq_sitenames2ids(names)
+    assert siteids.index.tolist() == [10, 11, 12, 13]
+    assert siteids[10] == saq_sitename2id("Cox's Bazar School") == 'cox_bazar'
+    assert siteids[11] == 'u_dhaka'
+    assert pd.isna(siteids[12])
+    assert saq_sitenames2ids(['Airport-Univ']).tolist() == ['apt_u']
+
+def write_level1(path, sitenames, start, raw_header=True):
+    """Write a small Level1.csv file with one row per site and 15 minute step."""
+    header = (['Site Name', 'Serial', 'Timestamp (UTC)', 'PM2.5 (ug/m3)', 'Applied PM2.5 Custom Calibration Factor',
+               'Latitude', 'Longitude', 'Temperature (C)'])
+    if not raw_header:
+        header = [r_column_name(name) for name in header]
+    times = pd.date_range(start, periods=4, freq='15min')
+    rows = [[site, 1, t.strftime('%Y-%m-%d %H:%M:%S'), 10.0 + i, '' if i == 0 else 1.5, 23.7, 90.4, 30]
+            for site in sitenames for i, t in enumerate(times)]
+    pd.DataFrame(rows, columns=header).to_csv(path, index=False)
+
+def test_read_level1_files_filters_sites(tmp_path):
+    """Test that Level1 files are read with the needed columns, filtered by site and concatenated once."""
+    write_level1(tmp_path / 'a.csv', ['Siteone', 'Sitetwo'], '2023-01-01 00:00')
+    write_level1(tmp_path / 'b.csv', ['Siteone'], '2023-01-01 01:00', raw_header=False)
+    write_level1(tmp_path / 'c.csv', ['Sitethree'], '2023-01-01 00:00')
+    tb_all = read_level1_files([tmp_path / 'a.csv', tmp_path / 'b.csv', tmp_path / 'c.csv'],
+                               sitenames=['Siteone'], timezone_output='Asia/Dhaka')
+    assert list(tb_all.columns) == ['sitename', 'date', 'pm25', 'pm25_scale', 'Latitude', 'Longitude']
+    assert len(tb_all) == 8
+    assert tb_all['sitename'].dtype == 'category' and set(tb_all['sitename']) == {'Siteone'}
+    assert str(tb_all['date'].dt.tz) == 'Asia/Dhaka'
+    assert tb_all['date'].iloc[0] == pd.Timestamp('2023-01-01 06:00', tz='Asia/Dhaka')
+    assert tb_all['pm25_scale'].isna().sum() == 2
+
+def test_read_level1_sites_by_serial(tmp_path):
+    """Test that Level1 files are found by serial number, read in parallel and tagged with the siteid."""
+    tb_sites = pd.DataFrame({'sitename': ['Siteone', 'Sitetwo', 'Sitethree'],
+                             'siteid': ['bgd_one', 'bgd_two', 'bgd_three'],
+                             'serial_number': [81432124031, 81432124034, 81432123012]})
+    for period, start in (('2023-01-01_2023-02-01', '2023-01-01 00:00'), ('2023-02-01_2023-03-01', '2023-02-01 00:00')):
+        for sitename, serial in zip(tb_sites['sitename'], tb_sites['serial_number']):
+            (tmp_path / period / str(serial)).mkdir(parents=True)
+            write_level1(tmp_path / period / str(serial) / 'Level1.csv', [sitename], start)
+
+    assert len(find_level1_files(tmp_path, [81432124031])) == 2
+    tb_all = read_level1_sites(tb_sites, tmp_path, siteids=['bgd_one', 'bgd_three'], workers=4)
+    assert len(tb_all) == 16
+    assert tb_all['siteid'].dtype == 'category'
+    assert tb_all.groupby('siteid', observed=True)['sitename'].first().astype(str).to_dict() == \
+        {'bgd_one': 'Siteone', 'bgd_three': 'Sitethree'}
+
+def test_level1_deduplicator_per_file(tmp_path):
+    """Test that duplicate (site, timestamp) rows are dropped file by file and counted per file."""
+    write_level1(tmp_path / 'a.csv', ['Siteone', 'Sitetwo'], '2023-01-01 00:00')
+    write_level1(tmp_path / 'b.csv', ['Siteone', 'Siteone', 'Sitetwo'], '2023-01-01 00:30')
+    deduplicator = Level1Deduplicator('sitename')
+    tb_all = read_level1_files([tmp_path / 'a.csv', tmp_path / 'b.csv'], deduplicator=deduplicator)
+    # b.csv: Siteone repeated within the file (4) and overlapping a.csv (2), Sitetwo overlapping (2)
+    assert deduplicator.counts == {tmp_path / 'a.csv': 0, tmp_path / 'b.csv': 8}
+    assert deduplicator.nduplicates == 8
+    assert len(tb_all) == 12
+    assert not tb_all.duplicated(subset=['sitename', 'date']).any()
+    # The first occurrence is kept: the 00:30 row of Siteone comes from a.csv (pm25 12)
+    row = tb_all[(tb_all['sitename'] == 'Siteone') & (tb_all['date'] == pd.Timestamp('2023-01-01 00:30', tz='UTC'))]
+    assert row['pm25'].tolist() == [12.0]
+
+def test_apply_pm25_scale_per_site(tmp_path):
+    """Test that the single calibration factor of a site is applied to its rows without pm25_scale."""
+    write_level1(tmp_path / 'a.csv', ['Siteone', 'Sitetwo', 'Sitethree'], '2023-01-01 00:00')
+    tb_all = read_level1_files([tmp_path / 'a.csv'])
+    tb_all.loc[tb_all['sitename'] == 'Sitetwo', 'pm25_scale'] = [float('nan'), 1.5, 2.0, 2.0]
+    tb_all.loc[tb_all['sitename'] == 'Sitethree', 'pm25_scale'] = float('nan')
+    tb_scale = apply_pm25_scale(tb_all, site_column='sitename')
+    assert tb_scale['nscale'].to_dict() == {'Siteone': 1, 'Sitetwo': 2, 'Sitethree': 0}
+    assert tb_scale['nfilled'].to_dict() == {'Siteone': 1, 'Sitetwo': 0, 'Sitethree': 0}
+    assert tb_scale['pm25_scale'].isna().to_dict() == {'Siteone': False, 'Sitetwo': True, 'Sitethree': True}
+    # Only the first Siteone row is scaled
+    assert tb_all['pm25'].tolist() == [15.0, 11.0, 12.0, 13.0] + [10.0, 11.0, 12.0, 13.0] * 2
+    assert tb_all['pm25_v0'].iloc[1] == pytest.approx(11.0 / 1.5)
+    assert tb_all['pm25_scale_calc'].iloc[1] == pytest.approx(1.5)
+
+def test_aggregate_pm25_regular_grid(tmp_path):
+    """Test that hourly statistics per site match a pandas groupby and fill the gaps of the time grid."""
+    write_level1(tmp_path / 'a.csv', ['Siteone'], '2023-01-01 00:00')
+    write_level1(tmp_path / 'b.csv', ['Siteone', 'Sitetwo'], '2023-01-01 02:30')
+    tb_all = read_level1_files([tmp_path / 'a.csv', tmp_path / 'b.csv'], timezone_output='Asia/Dhaka')
+    tbhr = aggregate_pm25(tb_all, '1h', completeness=0.5)
+    assert list(tbhr.columns) == ['sitename', 'date', 'pm25', 'pm25count', 'pm25std', 'pm25min', 'pm25max',
+                                  'Latitude', 'Longitude']
+    # 4 hours (06:00 to 09:00 local) for each site
+    assert len(tbhr) == 8
+    assert tbhr['date'].iloc[0] == pd.Timestamp('2023-01-01 06:00', tz='Asia/Dhaka')
+    siteone = tbhr[tbhr['sitename'] == 'Siteone']
+    assert siteone['pm25count'].tolist() == [4, 0, 2, 2]
+    assert siteone['pm25'].iloc[1:].isna().tolist() == [True, False, False]
+    expected = tb_all.groupby(['sitename', pd.Grouper(key='date', freq='1h')], observed=True)['pm25'].agg(
+        ['mean', 'std', 'min', 'max'])
+    assert siteone['pm25'].iloc[0] == pytest.approx(expected['mean'].iloc[0])
+    assert siteone['pm25std'].iloc[0] == pytest.approx(expected['std'].iloc[0])
+    assert (siteone['pm25min'].iloc[0], siteone['pm25max'].iloc[0]) == (10.0, 13.0)
+    sitetwo = tbhr[tbhr['sitename'] == 'Sitetwo']
+    assert sitetwo['pm25count'].tolist() == [0, 0, 2, 2]
+    # With 3 of 4 values required only the first Siteone hour is complete
+    assert aggregate_pm25(tb_all, '1h', completeness=0.75)['pm25'].notna().sum() == 1
+    assert tbhr['Latitude'].tolist() == [23.7] * 8
+
+def test_aggregate_pm25_daylight_saving():
+    """Test that the clock hour repeated at the end of daylight saving time gives two intervals, as pd.Grouper."""
+    dates = pd.date_range(pd.Timestamp('2022-11-06 00:00', tz='America/New_York'), periods=16, freq='15min')
+    tb = pd.DataFrame({'sitename': 'Siteone', 'date': dates, 'pm25': np.arange(16.0)})
+    tbhr = aggregate_pm25(tb, '1h')
+    expected = tb.groupby(pd.Grouper(key='date', freq='1h'))['pm25'].agg(['mean', 'count'])
+    assert tbhr['date'].tolist() == expected.index.tolist()
+    assert tbhr['pm25count'].tolist() == expected['count'].tolist() == [4, 4, 4, 4]
+    assert tbhr['pm25'].tolist() == expected['mean'].tolist() == [1.5, 5.5, 9.5, 13.5]
+    # Whole days follow the local calendar
+    assert aggregate_pm25(tb, '1D')['pm25count'].tolist() == [16]
+
+def test_ebs_read_tbe_from_tbe_file(tmp_path):
+    """Test that ebs_read_tbe takes a TBEFile already parsed by read_tbe_file without reading the file again."""
+    flin = tmp_path / 'saq_bluesky_dku_20210715_20230131_inv_tbe.csv'
+    shutil.copy('./sample_data/saq_bluesky_dku_20210715_20230131_inv_tbe.csv', flin)
+    expected = ebs_read_tbe(flin=str(flin), flsource='', tblselect=None)['result']
+    tbe_file = read_tbe_file(flin)
+    os.remove(flin)
+    result = ebs_read_tbe(flin=tbe_file)['result']
+    assert list(result) == list(expected)
+    for key, tf_tbl in expected.items():
+        if tf_tbl is None:
+            assert result[key] is None
+        else:
+            pd.testing.assert_frame_equal(result[key], tf_tbl)
+    assert list(ebs_read_tbe(flin=tbe_file, tblselect='Sites')['result']) == ['sites', 'tc_sites']
+
+    # A delimiter-only row inside a data block is a row of missing values in both paths
+    flin = tmp_path / 'blank_row_tbe.csv'
+    flin.write_text(
+        "TBL Data,siteid,value\n"
+        "ATT Units,Name,Integer\n"
+        "BGN,a,1\n"
+        ",b,2\n"
+        ",,\n"
+        ",c,3\n"
+        "EOT Data,d,4\n"
+    )
+    expected = ebs_read_tbe(flin=str(flin), flsource='')['result']['data']
+    result = ebs_read_tbe(flin=read_tbe_file(flin))['result']['data']
+    assert len(result) == len(expected) == 5
+    assert result['value'].dtype == expected['value'].dtype == 'float64'
+    assert result['value'].isna().tolist() == expected['value'].isna().tolist() == [False, False, True, False, False]
+
 # def parse_tbe(file_path):
 #     """Parses a TBE file into a structured dictionary of tables."""
 #     tables = {}
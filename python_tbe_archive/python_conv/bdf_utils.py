@@ -1,4 +1,6 @@
 import re
+from functools import lru_cache
+
 import pandas as pd
 import numpy as np
 
@@ -18,30 +20,62 @@ def printf(*args):
     """
     print(*args, "\n")
 
+# Substitutions of saq_sitename2id, applied in order to the lower case site name
+SITEID_SUBSTITUTIONS = [
+    (re.compile(r'[.,\'() /-]+'), '_'),
+    (re.compile(r'(?i)_of_'), '_'),
+    (re.compile(r'(?i)university'), 'u'),
+    (re.compile(r'(?i)univ'), 'u'),
+    (re.compile(r'(?i)airport'), 'apt'),
+    (re.compile(r'(?i)campus'), ''),
+    (re.compile(r'(?i)school'), ''),
+    (re.compile(r'_+$'), ''),
+    (re.compile(r'^_+'), ''),
+    (re.compile(r'_+'), '_'),
+    (re.compile(r'cox_s'), 'cox'),  # shorten cox_s_bazar to cox_bazar
+]
+SITEID_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=SITEID_CACHE_SIZE)
 def saq_sitename2id(stname=''):
     """
     Make siteid from sitename by removing special characters and shortening
     siteid is lower case, snake case
 
+    The patterns are compiled once (SITEID_SUBSTITUTIONS) and the results are
+    kept in an LRU cache, so repeated site names are only converted once.
+
     Returns:
     - Shortened site name for use in programming
 
     Family: bdf_utils
     """
     stid = stname.lower()
-    stid = re.sub(r'[.,\'() /-]+', '_', stid)
-    stid = re.sub(r'(?i)_of_', '_', stid)
-    stid = re.sub(r'(?i)university', 'u', stid)
-    stid = re.sub(r'(?i)univ', 'u', stid)
-    stid = re.sub(r'(?i)airport', 'apt', stid)
-    stid = re.sub(r'(?i)campus', '', stid)
-    stid = re.sub(r'(?i)school', '', stid)
-    stid = re.sub(r'_+$', '', stid)
-    stid = re.sub(r'^_+', '', stid)
-    stid = re.sub(r'_+', '_', stid)
-    stid = re.sub(r'cox_s', 'cox', stid)  # shorten cox_s_bazar to cox_bazar
+    for pattern, replacement in SITEID_SUBSTITUTIONS:
+        stid = pattern.sub(replacement, stid)
     return stid
 
+def saq_sitenames2ids(stnames):
+    """
+    Make siteids for many site names at once (vectorized saq_sitename2id)
+
+    Each distinct site name is converted once, then the ids are broadcast to
+    all rows, so a column of raw Level1 rows with a few dozen sites costs a few
+    dozen conversions.
+
+    Parameters:
+    - stnames: Series, list or array of site names
+
+    Returns:
+    - Series of siteids (same index as stnames if it is a Series); missing names stay missing
+
+    Family: bdf_utils
+    """
+    stnames = stnames if isinstance(stnames, pd.Series) else pd.Series(stnames, dtype=object)
+    codes, uniques = pd.factorize(stnames)
+    ids = np.array([saq_sitename2id(str(stname)) for stname in uniques] + [np.nan], dtype=object)
+    return pd.Series(ids[codes], index=stnames.index, name=stnames.name)
+
 def get_attribute(tc=[('date','pm25','pm10'),
                       ('Asia/Dhaka','ug/m3','ug/m3'),
                       ('Local Time','PM2.5','PM10')],
@@ -1,11 +1,13 @@
-import glob
 from datetime import datetime
 from pytz import timezone
 import pandas as pd
 from tzlocal import get_localzone
 from typing import Optional, List
 
-from ebs_read_tbe import ebs_read_tbe
+# TBE reader, Level1 ingestion and aggregation stages from the library (run with PYTHONPATH set to the repository root)
+from python.src.functions.ebs_read_tbe import ebs_read_tbe
+from python.src.functions.level1_ingest import Level1Deduplicator, apply_pm25_scale, read_level1_sites
+from python.src.functions.pm25_aggregate import aggregate_pm25
 
 
 def dks_uread_blueskyv2b():
@@ -77,8 +79,8 @@ def dks_uread_blueskyv2b():
     #     print("key:", key, "value:", value)
 
     if 'error' not in rtn or rtn['error'] is None:
-        tc_sites = rtn['result']['tc_global']
-        tb_sites = rtn['result']['tc_sites'] ## This will need to be changed in ebs_read_tbe to return as tb_sites instead of tc_sites
+        tc_sites = rtn['result']['tc_sites']
+        tb_sites = rtn['result']['sites']
         if tb_sites is None or tc_sites is None:
             print("Warning: tb_sites or tc_sites not found in the input file.")
     else:
@@ -86,15 +88,6 @@ def dks_uread_blueskyv2b():
 
     print(tb_sites)
 
-    tb_select = tb_sites[tb_sites[2].isin(asites)]
-    aserial = tb_select[3]
-    asitenames = tb_select[1]
-    aflin = []
-
-    for ns in aserial:
-        afldata = glob.glob(f'{indir}*/{ns}/Level1.csv')
-        aflin.extend(afldata)
-
     timezone_output = 'Asia/Kathmandu'
 
     docheckduplicates = 1
@@ -111,66 +104,29 @@ def dks_uread_blueskyv2b():
     doraw = 1
     do24hr = 1
 
-    nf = 0
-    tb_all = []
-
-    for flin in aflin:
-        tf = pd.read_csv(flin)
-        tb_step = pd.DataFrame(tf)
-
-        tb_sub = tb_step[tb_step['Site.Name'].isin(asitenames)]
-
-        if tb_sub.empty:
-            continue
-
-        tb_sub['date'] = pd.to_datetime(tb_sub['Timestamp..UTC.'], format='%Y-%m-%d %H:%M:%S')
-        tb_sub['date'] = tb_sub['date'].dt.tz_localize('UTC').dt.tz_convert(timezone_output)
-
-        tb_sub.rename(columns={'PM2.5..ug.m3.': 'pm25', 'Applied.PM2.5.Custom.Calibration.Factor': 'pm25_scale', 'Site.Name': 'sitename'}, inplace=True)
-        tb_sub['sitename'] = tb_sub['sitename'].astype('category')
-
-        print(f"Read {flin}: {len(tb_sub)} rows from {tb_sub['date'].min()} to {tb_sub['date'].max()}")
-
-        if nf == 0:
-            tb_all = tb_sub.copy()
-        else:
-            tb_all = pd.concat([tb_all, tb_sub], ignore_index=True)
-
-        nf += 1
-
-    tb_all.sort_values(by=['sitename', 'date'], inplace=True)
-    print(f"Read {nf} files, {len(tb_all)} rows from {tb_all['date'].min()} to {tb_all['date'].max()}")
+    # Read the Level1 files of the selected sites (by serial number) in parallel,
+    # only the needed columns, concatenated once, with the siteid of each row;
+    # duplicate (siteid, date) rows of overlapping files are dropped file by file
+    deduplicator = Level1Deduplicator('siteid') if docheckduplicates else None
+    tb_all = read_level1_sites(tb_sites, indir, siteids=asites, timezone_output=timezone_output,
+                               deduplicator=deduplicator)
 
     if docheckduplicates:
-        tb_duplicates = tb_all[tb_all.duplicated(subset=['sitename', 'date'], keep=False)]
-        ndup = len(tb_duplicates)
-
-        if ndup > 0:
-            print(f"Found {ndup} duplicates")
+        if deduplicator.nduplicates > 0:
+            print(f"Found {deduplicator.nduplicates} duplicates")
             if doprintduplicates:
-                for i, row in tb_duplicates.iterrows():
-                    print(f"Duplicate {i + 1}: {row['date']}, {row['sitename']}")
-
-        tb_all.drop_duplicates(subset=['sitename', 'date'], keep='first', inplace=True)
+                for flin, ndup in deduplicator.counts.items():
+                    if ndup > 0:
+                        print(f"Duplicates: {ndup} in {flin}")
         print(f"Duplicate check: {len(tb_all)} rows kept")
 
-    tb_all['pm25_v0'] = tb_all['pm25'] / tb_all['pm25_scale']
-
-    for sitesct in asites:
-        tbs = tb_all[tb_all['sitename'] == sitesct]
-        pm25_factor = tbs['pm25_scale'].dropna().unique()
-
-        if len(pm25_factor) == 0:
-            print(f"pm25_scale not found for {sitesct}, do nothing")
-        elif len(pm25_factor) == 1:
-            tbcount = tbs[tbs['pm25_scale'].isna()].shape[0]
-
-            tb_all.loc[(tb_all['sitename'] == sitesct) & (tb_all['pm25_scale'].isna()), 'pm25'] *= pm25_factor[0]
-            tb_all['pm25_scale_calc'] = tb_all['pm25'] / tb_all['pm25_v0']
+    tb_all.sort_values(by=['sitename', 'date'], inplace=True)
 
-            print(f"Applied pm25_scale = {pm25_factor[0]} to {tbcount} values from site {sitesct} for which pm25_scale==NA")
-        else:
-            print(f"Multiple pm25_scale found for {sitesct}, do nothing for now")
+    # Apply the calibration factor of each site to the values recorded without it
+    tb_scale = apply_pm25_scale(tb_all, site_column='siteid')
+    missing_sites = [sitesct for sitesct in asites if sitesct not in tb_scale.index]
+    if missing_sites:
+        print(f"No data found for sites {missing_sites}")
 
     if timeminsct is not None:
         tb_all = tb_all[tb_all['date'] >= timeminsct]
@@ -196,20 +152,15 @@ def dks_uread_blueskyv2b():
     # Plot using timetk
     print("For timetk plot, from RStudio Console: tb %>% group_by(sitename) %>% plot_time_series(date,pm25)")
 
-    tbhr = tb_all.groupby(['sitename', pd.Grouper(key='date', freq='H', closed='left')]).agg({'pm25': 'mean', 'sitename': 'first'}).reset_index()
-    tbhr = tbhr.asfreq(freq='H')
-    
-    if docoords == 1:
-        tbhr = pd.merge(tbhr, tb_all.groupby('sitename').last()[['Latitude', 'Longitude']], on='sitename')
-        
-        if do24hr:
-            tb24hr = tb_all.groupby(['sitename', pd.Grouper(key='date', freq='D', closed='left')]).agg({'pm25': 'mean', 'sitename': 'first'}).reset_index()
-            tb24hr = tb24hr.asfreq(freq='D')
-            tb24hr = pd.merge(tb24hr, tb_all.groupby('sitename').last()[['Latitude', 'Longitude']], on='sitename')
-
-    # Get duration interval
-    thr_duration = tbhr.groupby(pd.Grouper(key='date', freq='H')).size().value_counts()
-    print("Table of duration for hourly data:")
+    # Hourly and 24 hour statistics per site on a regular time grid, one pass each:
+    # pm25 (mean), pm25count, pm25std, pm25min, pm25max and the site coordinates
+    tbhr = aggregate_pm25(tb_all, '1h', site_column='sitename', sample_freq=tinterval_str, coords=docoords == 1)
+    if do24hr:
+        tb24hr = aggregate_pm25(tb_all, '1D', site_column='sitename', sample_freq=tinterval_str, coords=docoords == 1)
+
+    # Get number of values per hour
+    thr_duration = tbhr['pm25count'].value_counts().sort_index()
+    print("Table of number of values per hour for hourly data:")
     print(thr_duration)
 
     tbhr_valid = tbhr.dropna(subset=['pm25'])
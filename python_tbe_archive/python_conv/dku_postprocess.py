@@ -2,6 +2,8 @@ import pandas as pd
 from plotnine import ggplot, geom_line, aes, theme, element_text
 from openair import timeVariation, summaryPlot
 
+from bdf_utils import saq_sitenames2ids
+
 # Set the directory and file name for the input data
 indir = ""
 flroot = "dku_bluesky_rajshahi_ns4_20220421_20230501_coords_hr_lt"
@@ -133,8 +135,8 @@ print(ptv)
 # Time Variation plot for each site one by one
 if doallsites:
     asites = tb["sitename"].unique()
-    for sitesct in asites:
-        siteid = saq_sitename2id(sitesct)
+    asiteids = saq_sitenames2ids(asites)
+    for sitesct, siteid in zip(asites, asiteids):
         ptv = timeVariation(
             tb[tb["sitename"] == sitesct],
             pollutant="pm25",